@@ -1,5 +1,7 @@
 from xml.etree import ElementTree as ET
-from urllib.parse import unquote, unquote_plus
+from urllib.parse import unquote
+from pathlib import Path
+import argparse
 import os
 import base64
 import csv
@@ -7,14 +9,13 @@ import json
 import re
 import sys
 
-log_path = 'burpsuite_sample_log.log'
-output_path = 'train_data.csv'
+# Feature counting is shared with the backend (python_backend/feature_extractor.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "python_backend"))
+from feature_extractor import extract_features  # noqa: E402
 
-badwords = [
-    'sleep','drop','uid','select','waitfor','delay','system',
-    'union','order by','group by','insert','update','delete',
-    'benchmark','and 1=1','or 1=1'
-]
+log_path = 'burpsuite_sample_log.log'
+# not train_data.csv: parsing the sample log must not replace the committed training set
+output_path = 'parsed_log.csv'
 
 def decode_log(log_path):
     """
@@ -47,6 +48,26 @@ def decode_log(log_path):
     return result
 
 
+def iter_log_items(log_path):
+    """
+    Yields {"time": str, "request": bytes} for every <item> of a Burp Suite
+    XML export, in capture order. Unlike decode_log, duplicate requests are
+    kept and the capture time is preserved (used for replay timing). The file
+    is parsed incrementally, one item in memory at a time.
+    """
+    for _, item in ET.iterparse(log_path, events=("end",)):
+        if item.tag != 'item':
+            continue
+        node = item.find('request')
+        if node is not None and node.text:
+            if node.get('base64') == 'true':
+                raw_req = base64.b64decode(unquote(node.text))
+            else:
+                raw_req = node.text.encode("utf-8")
+            yield {"time": item.findtext('time'), "request": raw_req}
+        item.clear()
+
+
 def parse_log(rawreq):
     """Parses raw HTTP request string."""
     if isinstance(rawreq, bytes):
@@ -92,7 +113,7 @@ def classify_request(single_q, double_q, dashes, braces, spaces, badwords_count,
     score += braces * 1
 
     # Your logic: suspicious -> 0, normal -> 1
-    return "bad" if score >= threshold else "good"
+    return 0 if score >= threshold else 1
 
 
 # -------------------------
@@ -105,34 +126,20 @@ def ExtractFeatures(method, path_enc, body_enc, headers):
     body_enc = body_enc or ""
     headers = headers or {}
 
-    # decode URL-encoding for counting (do not re-encode)
-    path = unquote_plus(path_enc)
-    body = unquote(body_enc)
-
-    single_q = path.count("'") + body.count("'")
-    double_q = path.count('"') + body.count('"')
-    dashes = path.count("--") + body.count("--")
-    braces = path.count("(") + body.count("(")
-    spaces = path.count(" ") + body.count(" ")
-
-    # badwords counting (case-insensitive)
-    badwords_count = 0
-    for word in badwords:
-        if not word:
-            continue
-        badwords_count += path.lower().count(word.lower())
-        badwords_count += body.lower().count(word.lower())
-
-    # count badwords in headers too
-    for hname, hval in headers.items():
-        val = (hval or "").lower()
-        for word in badwords:
-            badwords_count += val.count(word.lower())
+    # same normalisation + counting as the proxy and the API (headers count towards badwords)
+    features = extract_features(path_enc, body_enc, headers, feature_set="base")
+    single_q = features["single_q"]
+    double_q = features["double_q"]
+    dashes = features["dashes"]
+    braces = features["braces"]
+    spaces = features["spaces"]
+    badwords_count = features["badwords"]
 
     # classify: returns int 0 or 1
     class_value = classify_request(single_q, double_q, dashes, braces, spaces, badwords_count)
 
-    # Return types: keep path & body AS STRINGS (no bytes)
+    # Return types: keep path & body AS STRINGS (no bytes); headers as JSON
+    # so train_model.py can compute the header features
     return [
         method,
         path_enc.strip(),
@@ -143,7 +150,8 @@ def ExtractFeatures(method, path_enc, body_enc, headers):
         braces,
         spaces,
         badwords_count,
-        class_value
+        class_value,
+        json.dumps(headers)
     ]
 
 
@@ -151,58 +159,71 @@ def ExtractFeatures(method, path_enc, body_enc, headers):
 # PROCESS FILE & SAVE CSV
 # ============================
 
-results = decode_log(log_path)
-parsed_requests = []
-
-for raw_base64 in results:
-    decoded = base64.b64decode(raw_base64)
-    parsed_requests.append(parse_log(decoded))
-
-# write CSV
-# with open(output_path, "w", newline="", encoding="utf-8") as f:
-#     writer = csv.writer(f)
-#     writer.writerow([
-#         "method","path","body","single_q","double_q","dashes",
-#         "braces","spaces","badwords","class"
-#     ])
-
-#     for item in parsed_requests:
-#         row = ExtractFeatures(
-#             item['method'],
-#             item['path'],
-#             item['body'],
-#             item['headers']
-#         )
-#         writer.writerow(row)
-
-# print("[+] CSV saved:", output_path)
-
-with open(output_path, "w", newline="", encoding="utf-8") as f:
-    # Improved writer with quoting
-    writer = csv.writer(
-        f,
-        delimiter=",",
-        quotechar='"',         # wrap fields in double quotes when necessary
-        quoting=csv.QUOTE_MINIMAL,  # only quote fields that need it
-        escapechar='\\'        # escape quotes inside fields
-    )
-
-    # Write header
-    writer.writerow([
-        "method", "path", "body", "single_q", "double_q", "dashes",
-        "braces", "spaces", "badwords", "class"
-    ])
-
-    # Write data rows
-    for item in parsed_requests:
-        row = ExtractFeatures(
-            item['method'],
-            item['path'],
-            item['body'],
-            item['headers']
+def main():
+    parser = argparse.ArgumentParser(description="Burp Suite XML export -> labelled training CSV.")
+    parser.add_argument("log", nargs="?", default=log_path, help=f"Burp Suite XML export (default {log_path})")
+    parser.add_argument("-o", "--output", default=output_path, help=f"CSV to write (default {output_path})")
+    parser.add_argument("--force", action="store_true", help="overwrite the output if it exists")
+    args = parser.parse_args()
+    if os.path.exists(args.output) and not args.force:
+        sys.exit(f"[+] Error: {args.output} exists, pass --force to overwrite it")
+
+    results = decode_log(args.log)
+    parsed_requests = []
+
+    for raw_base64 in results:
+        decoded = base64.b64decode(raw_base64)
+        parsed_requests.append(parse_log(decoded))
+
+    # write CSV
+    # with open(output_path, "w", newline="", encoding="utf-8") as f:
+    #     writer = csv.writer(f)
+    #     writer.writerow([
+    #         "method","path","body","single_q","double_q","dashes",
+    #         "braces","spaces","badwords","class"
+    #     ])
+
+    #     for item in parsed_requests:
+    #         row = ExtractFeatures(
+    #             item['method'],
+    #             item['path'],
+    #             item['body'],
+    #             item['headers']
+    #         )
+    #         writer.writerow(row)
+
+    # print("[+] CSV saved:", output_path)
+
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        # Improved writer with quoting
+        writer = csv.writer(
+            f,
+            delimiter=",",
+            quotechar='"',         # wrap fields in double quotes when necessary
+            quoting=csv.QUOTE_MINIMAL,  # only quote fields that need it
+            escapechar='\\'        # escape quotes inside fields
         )
-        # Ensure all elements are strings
-        row = [str(i) for i in row]
-        writer.writerow(row)
 
-print("[+] CSV saved:", output_path)
+        # Write header
+        writer.writerow([
+            "method", "path", "body", "single_q", "double_q", "dashes",
+            "braces", "spaces", "badwords", "class", "headers"
+        ])
+
+        # Write data rows
+        for item in parsed_requests:
+            row = ExtractFeatures(
+                item['method'],
+                item['path'],
+                item['body'],
+                item['headers']
+            )
+            # Ensure all elements are strings
+            row = [str(i) for i in row]
+            writer.writerow(row)
+
+    print("[+] CSV saved:", args.output)
+
+
+if __name__ == "__main__":
+    main()
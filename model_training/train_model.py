@@ -0,0 +1,206 @@
+# train_model.py
+#
+# Reproducible replacement for the training cells of randomforest.ipynb.
+#
+# Reads the CSV written by log_parser.py (method, path, body, ..., class),
+# recomputes features with python_backend/feature_extractor.py so training and
+# serving share one implementation, trains a RandomForest per feature set and
+# reports accuracy next to extraction and inference cost:
+#
+#   python train_model.py                         # compare base vs extended
+#   python train_model.py --save extended -o rf_model.pkl
+#   python train_model.py --report report.json --check-budget
+#   python train_model.py --save base -o ../python_backend/model.pkl --artifact ../python_backend/model.wafrf
+import argparse
+import csv
+import gc
+import json
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, confusion_matrix, precision_score, recall_score
+from sklearn.model_selection import train_test_split
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "python_backend"))
+
+from feature_extractor import (  # noqa: E402
+    COST_BUDGET_US_PER_KB,
+    COST_BUDGET_US_PER_REQUEST,
+    FEATURE_SETS,
+    extract_features,
+    to_matrix,
+)
+
+MALICIOUS = 0  # class 0 = malicious, 1 = normal (as written by log_parser.py)
+# older log_parser.py versions wrote the class as "bad" / "good"
+LABELS = {"0": 0, "1": 1, "bad": 0, "good": 1}
+
+
+def load_requests(csv_path):
+    """Returns [(path, body, headers)] and the class labels."""
+    requests, labels = [], []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f, escapechar="\\")
+        if "headers" not in (reader.fieldnames or []):
+            print(f"[!] {csv_path} has no headers column, the hdr_* features will all be 0 "
+                  f"(export a capture with headers: python log_parser.py <burp.xml> -o new.csv, "
+                  f"then --data new.csv)")
+        for row in reader:
+            label = row["class"].strip().lower()
+            if label not in LABELS:
+                raise ValueError(f"{csv_path}: unknown class label {row['class']!r}")
+            headers = json.loads(row["headers"]) if row.get("headers") else {}
+            requests.append((row["path"], row["body"], headers))
+            labels.append(LABELS[label])
+    return requests, np.array(labels)
+
+
+def _best_of(fn, repeat=7):
+    # like timeit: collector pauses triggered by the training data are not extraction cost
+    gc.disable()
+    try:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best * 1e6
+
+
+def extraction_cost(requests, feature_set, payload_kb=32):
+    """
+    Extraction cost in microseconds: the fixed part per request (measured on
+    the real, mostly tiny, requests) and the marginal part per KB (measured
+    on one large payload stitched together from the same requests).
+    """
+    def run_all():
+        for path, body, headers in requests:
+            extract_features(path, body, headers, feature_set=feature_set)
+
+    per_request = _best_of(run_all) / len(requests)
+
+    payload = "&".join(f"{p}{b}" for p, b, _ in requests)
+    payload = (payload * (payload_kb * 1024 // max(len(payload), 1) + 1))[:payload_kb * 1024]
+    per_kb = (_best_of(lambda: extract_features(payload, "", {}, feature_set=feature_set))
+              - per_request) / payload_kb
+    return per_request, max(per_kb, 0.0)
+
+
+def inference_cost(model, X, names, samples=200):
+    """
+    Per-request scoring cost (us) as served: TreePathExplainer.explain, the
+    code that evaluates the exported artifact, with its cache disabled so
+    every row is a miss.
+    """
+    from explainer import TreePathExplainer
+
+    explainer = TreePathExplainer(model, names, cache_size=0)
+    rows = [tuple(row) for row in X[:samples]]
+
+    def run_all():
+        for row in rows:
+            explainer.explain(row)
+
+    return _best_of(run_all, repeat=3) / len(rows)
+
+
+def train_feature_set(requests, labels, feature_set, args):
+    names = FEATURE_SETS[feature_set]
+    X = np.array(to_matrix(
+        (extract_features(p, b, h, feature_set=feature_set) for p, b, h in requests),
+        names,
+    ), dtype=float)
+
+    X_train, X_val, y_train, y_val = train_test_split(
+        X, labels, test_size=0.2, random_state=args.seed, stratify=labels
+    )
+    model = RandomForestClassifier(
+        n_estimators=args.n_estimators, random_state=args.seed, class_weight="balanced"
+    )
+    model.fit(X_train, y_train)
+    pred = model.predict(X_val)
+
+    us_per_req, us_per_kb = extraction_cost(requests, feature_set)
+    report = {
+        "feature_set": feature_set,
+        "n_features": len(names),
+        "accuracy": accuracy_score(y_val, pred),
+        "precision_malicious": precision_score(y_val, pred, pos_label=MALICIOUS, zero_division=0),
+        "recall_malicious": recall_score(y_val, pred, pos_label=MALICIOUS, zero_division=0),
+        "confusion_matrix": confusion_matrix(y_val, pred).tolist(),
+        "extract_us_per_kb": us_per_kb,
+        "extract_us_per_request": us_per_req,
+        "inference_us_per_request": inference_cost(model, X_val, names),
+        "within_budget": (us_per_req <= COST_BUDGET_US_PER_REQUEST
+                          and us_per_kb <= COST_BUDGET_US_PER_KB),
+    }
+    return model, report
+
+
+def print_report(reports):
+    print(f"{'set':<10}{'feat':>5}{'acc':>8}{'prec':>8}{'recall':>8}"
+          f"{'us/KB':>10}{'us/req':>9}{'infer us':>10}")
+    for r in reports:
+        flag = "" if r["within_budget"] else "  OVER BUDGET"
+        print(f"{r['feature_set']:<10}{r['n_features']:>5}{r['accuracy']:>8.4f}"
+              f"{r['precision_malicious']:>8.4f}{r['recall_malicious']:>8.4f}"
+              f"{r['extract_us_per_kb']:>10.1f}{r['extract_us_per_request']:>9.1f}"
+              f"{r['inference_us_per_request']:>10.1f}{flag}")
+    print(f"extraction budget: {COST_BUDGET_US_PER_REQUEST} us/req + {COST_BUDGET_US_PER_KB} us/KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the WAF RandomForest and compare feature sets.")
+    parser.add_argument("--data", default=str(HERE / "train_data.csv"), help="CSV written by log_parser.py")
+    parser.add_argument("--feature-sets", nargs="+", default=list(FEATURE_SETS), choices=list(FEATURE_SETS))
+    parser.add_argument("--save", choices=list(FEATURE_SETS), help="feature set whose model is saved")
+    parser.add_argument("-o", "--output", default="rf_model.pkl")
+    parser.add_argument("--artifact", help="also export the saved model as a memory-mapped .wafrf artifact")
+    parser.add_argument("--threshold", type=float, default=0.25, help="blocking threshold stored in the artifact")
+    parser.add_argument("--report", help="write the comparison as JSON")
+    parser.add_argument("--n-estimators", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--check-budget", action="store_true",
+                        help="exit non-zero if a feature set exceeds the extraction budget")
+    args = parser.parse_args()
+
+    requests, labels = load_requests(args.data)
+    print(f"[+] Loaded {len(requests)} requests from {args.data}")
+    counts = np.bincount(labels, minlength=2)
+    if counts.min() < 2:
+        sys.exit(f"[!] Need at least 2 malicious and 2 normal requests to train, got {counts.tolist()}")
+
+    reports = []
+    for feature_set in args.feature_sets:
+        model, report = train_feature_set(requests, labels, feature_set, args)
+        reports.append(report)
+        if feature_set == args.save:
+            joblib.dump(model, args.output)
+            print(f"[+] Saved {feature_set} model to {args.output}")
+            if args.artifact:
+                from model_artifact import export_model, file_sha256
+
+                export_model(model, args.artifact, args.threshold, feature_set=feature_set,
+                             source_sha256=file_sha256(args.output))
+                print(f"[+] Exported artifact to {args.artifact}")
+
+    print_report(reports)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        print("[+] Report saved:", args.report)
+
+    if args.check_budget and not all(r["within_budget"] for r in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,25 @@
 from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from proxy_server import start_proxy, stop_proxy
+from proxy_server import init_db, start_proxy, stop_proxy
+from feature_extractor import (
+    BAD_WORDS,
+    CATEGORY_KEYWORDS,
+    category_counts,
+    extract_features as extract_request_features,
+    normalize_request,
+)
+from explainer import describe, top_contributions
+from model_store import ModelLoadError, check_servable, get_model, prewarm
+from policy import get_policy_store
+from exporter import close_exporter, get_exporter
+from load_control import LoadConfigError, get_load_controller
+from contextlib import asynccontextmanager
 import urllib.request
 import urllib.parse
 import sqlite3
 import json
 import asyncio
-import requests
-import joblib
-import numpy as np
-from pathlib import Path
+import os
 from typing import Any, Dict, Optional, List
 from pydantic import BaseModel
 from datetime import datetime, timedelta
@@ -22,7 +32,24 @@ origins = [
     "http://127.0.0.1:5173"
 ]
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    # refuse to start rather than fail on the first request (no artifact, pickles not
+    # allowed, invalid WAF_FAIL_MODE / WAF_DEGRADE)
+    check_servable()
+    get_load_controller()
+    # Optional: load the model before the first request instead of on it
+    if os.environ.get("WAF_PREWARM", "").lower() in ("1", "true", "yes"):
+        await asyncio.to_thread(prewarm)
+    yield
+    stop_proxy()
+    # flush queued events and finish the current export file
+    close_exporter()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -47,24 +74,15 @@ async def broadcast_new_request(request_obj):
     active_clients[:] = living_clients
 
 
-MODEL_PATH = Path(__file__).with_name("model.pkl")
-MODEL = joblib.load(MODEL_PATH)
 THRESHOLD = 0.35
-BAD_WORDS = [
-    "sleep", "drop", "uid", "select", "waitfor", "delay", "system", "union",
-    "order by", "group by", "insert", "update", "delete", "benchmark",
-    "and 1=1", "or 1=1", "--", "#", "<script", "alert(", "set /", ";", "&&", "|"
-]
-SQLI_KEYWORDS = ["select", "union", "drop", "insert", "update", "' or", "' and", "--", "benchmark"]
-XSS_KEYWORDS = ["<script", "onerror", "onload", "alert(", "document.cookie"]
-CMDI_KEYWORDS = [";","&&","||","|","$(", "`", "cat ", "sleep ", "rm ", "curl ", "wget "]
 
 ATTACK_PATTERNS = {
-    "SQL Injection": ["select", "union", "drop", "' or", "' and", "sleep(", "--", "benchmark"],
-    "XSS": ["<script", "onerror", "onload", "alert(", "document.cookie"],
-    "Command Injection": ["; rm", "&&", "||", "|", "$(", "`", "chmod", "cat /etc/passwd", "curl ", "wget "],
-    "LFI": ["../", "..\\", "/etc/passwd", "system32", "php://"],
+    "SQL Injection": CATEGORY_KEYWORDS["sqli_kw"],
+    "XSS": CATEGORY_KEYWORDS["xss_kw"],
+    "Command Injection": CATEGORY_KEYWORDS["cmdi_kw"],
+    "LFI": CATEGORY_KEYWORDS["lfi_kw"],
 }
+PATTERN_WORDS = list(dict.fromkeys(BAD_WORDS + [k for keywords in ATTACK_PATTERNS.values() for k in keywords]))
 
 
 class AnalyzeRequestPayload(BaseModel):
@@ -81,27 +99,10 @@ class ReplayRequestPayload(BaseModel):
     body: Optional[str] = ""
 
 
-def _normalize_text(value: Optional[str]) -> str:
-    if not value:
-        return ""
-    return urllib.parse.unquote(value)
-
-
-def extract_features(url: str, body: Optional[str], headers: Optional[Dict[str, str]]) -> Dict[str, int]:
-    decoded_url = _normalize_text(url)
-    decoded_body = _normalize_text(body or "")
-    header_blob = " ".join(f"{k}:{v}" for k, v in (headers or {}).items())
-    combined = f"{decoded_url} {decoded_body} {header_blob}".strip()
-
-    return {
-        "single_q": combined.count("'"),
-        "double_q": combined.count('"'),
-        "dashes": combined.count("--"),
-        "braces": combined.count("("),
-        "spaces": combined.count(" "),
-        "badwords": sum(combined.lower().count(word) for word in BAD_WORDS),
-        "combined": combined
-    }
+def extract_features(url: str, body: Optional[str], headers: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    return extract_request_features(
+        url, body or "", headers, feature_set=get_model().feature_set, keep_text=True
+    )
 
 
 def _safe_json_loads(value: Optional[str]) -> Dict[str, Any]:
@@ -136,7 +137,7 @@ def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
 
 
 def _classify_attack(url: str, body: str) -> str:
-    combined = f"{url} {body}".lower()
+    combined, _ = normalize_request(url, body)
     scores = {key: 0 for key in ATTACK_PATTERNS.keys()}
     for attack_type, keywords in ATTACK_PATTERNS.items():
         scores[attack_type] = sum(1 for keyword in keywords if keyword in combined)
@@ -158,30 +159,18 @@ def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
     }
 
 def predict_from_features(features: Dict[str, Any]) -> Dict[str, Any]:
-    feature_vector = np.array([[
-        features["single_q"],
-        features["double_q"],
-        features["dashes"],
-        features["braces"],
-        features["spaces"],
-        features["badwords"],
-    ]])
-
-    if hasattr(MODEL, "predict_proba"):
-        proba = MODEL.predict_proba(feature_vector)[0]
-        malicious_prob = float(proba[0])  # class 0 assumed malicious
-    else:
-        prediction = MODEL.predict(feature_vector)[0]
-        malicious_prob = 0.7 if prediction == 0 else 0.1
+    model = get_model()
+    malicious_prob, verdict = model.score(features)  # class 0 assumed malicious
 
     blocked = malicious_prob >= THRESHOLD
     label = "Malicious" if blocked else "Normal"
     confidence = malicious_prob if blocked else 1 - malicious_prob
 
-    combined = features["combined"].lower()
-    sql_score = min(sum(combined.count(word) for word in SQLI_KEYWORDS) / 5, 1.0)
-    xss_score = min(sum(combined.count(word) for word in XSS_KEYWORDS) / 5, 1.0)
-    cmd_score = min(sum(combined.count(word) for word in CMDI_KEYWORDS) / 5, 1.0)
+    combined = features["combined"]
+    counts = category_counts(combined)
+    sql_score = min(counts["sqli_kw"] / 5, 1.0)
+    xss_score = min(counts["xss_kw"] / 5, 1.0)
+    cmd_score = min(counts["cmdi_kw"] / 5, 1.0)
     probabilities = {
         "Normal": max(0.0, 1.0 - malicious_prob),
         "SQLi": max(sql_score, malicious_prob * 0.6),
@@ -189,12 +178,16 @@ def predict_from_features(features: Dict[str, Any]) -> Dict[str, Any]:
         "Command Injection": cmd_score
     }
 
-    patterns = [word for word in BAD_WORDS if word in combined]
+    patterns = [word for word in PATTERN_WORDS if word in combined]
     explanation = (
         f"Detected {features['badwords']} suspicious token(s). "
         f"Single quotes: {features['single_q']}, double quotes: {features['double_q']}, "
         f"dashes: {features['dashes']}."
     )
+    contributions = []
+    if verdict is not None:
+        explanation += f" Model drivers: {describe(verdict, features)}."
+        contributions = top_contributions(verdict, features, limit=len(model.feature_names))
 
     return {
         "prediction": label,
@@ -202,7 +195,9 @@ def predict_from_features(features: Dict[str, Any]) -> Dict[str, Any]:
         "probabilities": probabilities,
         "maliciousPatterns": patterns,
         "explanation": explanation,
-        "maliciousProbability": malicious_prob
+        "maliciousProbability": malicious_prob,
+        "baseValue": verdict["baseValue"] if verdict else None,
+        "contributions": contributions,
     }
 
 def _build_dashboard_snapshot(limit: int = 1000) -> Dict[str, Any]:
@@ -352,6 +347,8 @@ async def check_phish(data: dict):
             "app_key": PHISHTANK_API_KEY
         }
 
+        import requests
+
         response = requests.post(phishtank_url, data=payload)
         result = response.json()
 
@@ -389,6 +386,8 @@ async def replay_request(payload: ReplayRequestPayload):
     if not payload.url:
         raise HTTPException(status_code=400, detail="URL is required")
 
+    import requests
+
     try:
         response = requests.request(
             method=method,
@@ -430,15 +429,42 @@ def get_pending():
             "malicious_prob": row[5],
             "malicious": bool(row[6]),
             "status": row[7],
-            "created_at": row[8]
+            "created_at": row[8],
+            "explanation": _safe_json_loads(row[9]) if len(row) > 9 else None
         })
 
     return pending_list
 
 
+@app.get("/policy")
+def get_policy():
+    return get_policy_store().snapshot()
+
+
+@app.post("/policy/reload")
+def reload_policy():
+    store = get_policy_store()
+    if not store.reload():
+        raise HTTPException(status_code=400, detail=store.last_error)
+    return store.snapshot()
+
+
+@app.get("/export/stats")
+def export_stats():
+    return get_exporter().stats()
+
+
+@app.get("/load")
+def load_state():
+    return get_load_controller().snapshot()
+
+
 @app.post("/startproxy")
 def start_proxy_api():
-    ok = start_proxy()
+    try:
+        ok = start_proxy()
+    except (ModelLoadError, LoadConfigError) as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
     return {"running": ok}
 
 
@@ -0,0 +1,118 @@
+# bench_normalize.py
+#
+# Parity check + throughput benchmark for normalizer.py / feature_extractor.py.
+#
+# Parity: every request in model_training/train_data.csv, sent as a raw HTTP
+# request with browser-like and with attack-bearing headers, must produce the
+# same base feature vector through the three real entry points:
+#   - log_parser.parse_log + ExtractFeatures  (training)
+#   - app.extract_features                    (API, /analyze-request)
+#   - proxy_server.request_features           (proxy: http.client-parsed headers,
+#                                              raw body bytes and a memoryview)
+# tests/test_normalizer.py runs the same check on a sample plus the decoding
+# regression cases.
+#
+# Throughput: MB/s of normalize() on plain ASCII, single- and double-encoded
+# payloads, for str and bytes input.
+#
+#   python benchmarks/bench_normalize.py [--rows N]
+import argparse
+import csv
+import http.client
+import io
+import sys
+import time
+import urllib.parse
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+TRAINING = BACKEND.parent / "model_training"
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(TRAINING))
+
+from feature_extractor import BASE_FEATURES, to_vector  # noqa: E402
+from log_parser import ExtractFeatures, parse_log  # noqa: E402
+from normalizer import normalize  # noqa: E402
+
+HEADER_SETS = (
+    {"Host": "shop.example", "User-Agent": "Mozilla/5.0", "Accept": "*/*"},
+    {"Host": "shop.example", "User-Agent": "sqlmap/1.7 (union select)", "Cookie": "id=1%27 or 1=1--"},
+)
+
+
+def load_rows(limit):
+    with open(TRAINING / "train_data.csv", newline="", encoding="utf-8") as f:
+        rows = [(r["method"], r["path"], r["body"]) for r in csv.DictReader(f, escapechar="\\")]
+    return rows[:limit] if limit else rows
+
+
+def raw_request(method, path, body, headers):
+    head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return f"{method} {path} HTTP/1.1\r\n{head}\r\n{body}".encode("utf-8")
+
+
+def entry_point_vectors(raw):
+    """Base vectors of one raw request through training, the API and the proxy (bytes, memoryview)."""
+    import app
+    from proxy_server import request_features
+
+    parsed = parse_log(raw)
+    training = ExtractFeatures(parsed["method"], parsed["path"], parsed["body"], parsed["headers"])[3:9]
+    api = to_vector(app.extract_features(parsed["path"], parsed["body"], parsed["headers"]), BASE_FEATURES)
+
+    head, _, body = raw.partition(b"\r\n\r\n")
+    request_line, _, header_block = head.partition(b"\r\n")
+    headers = http.client.parse_headers(io.BytesIO(header_block + b"\r\n\r\n"))
+    url = request_line.split(b" ")[1].decode("iso-8859-1")
+    proxy = to_vector(request_features(url, body, headers, "base"), BASE_FEATURES)
+    view = to_vector(request_features(url, memoryview(body), headers, "base"), BASE_FEATURES)
+    return training, api, proxy, view
+
+
+def check_parity(rows):
+    mismatches, total = 0, 0
+    for headers in HEADER_SETS:
+        for method, path, body in rows:
+            total += 1
+            vectors = entry_point_vectors(raw_request(method, path, body, headers))
+            if any(v != vectors[0] for v in vectors[1:]):
+                mismatches += 1
+                if mismatches <= 5:
+                    print("  mismatch:", path, body, headers, *vectors)
+    print(f"parity: {total - mismatches}/{total} identical (training / API / proxy bytes / proxy memoryview)")
+    return mismatches == 0
+
+
+def throughput(label, payloads):
+    size = sum(len(p) for p in payloads)
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for payload in payloads:
+            normalize(payload)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<28}{size / best / 1e6:>10.1f} MB/s{best * 1e6 / len(payloads):>10.2f} us/payload")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=0, help="limit the number of CSV rows")
+    args = parser.parse_args()
+
+    rows = load_rows(args.rows)
+    ok = check_parity(rows)
+
+    plain = [f"{path} {body}".replace("%", "") for _, path, body in rows]
+    single = [urllib.parse.quote(p) for p in plain]
+    double = [urllib.parse.quote(p) for p in single]
+
+    print("throughput:")
+    for label, payloads in (("plain", plain), ("url-encoded", single), ("double url-encoded", double)):
+        throughput(f"{label} (str)", payloads)
+        throughput(f"{label} (bytes)", [p.encode() for p in payloads])
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# bench_startup.py
+#
+# Cold-start benchmark for the API process. Every sample runs in a fresh
+# interpreter (so nothing is cached in sys.modules) and reports:
+#
+#   import    - time to `import app` and the resulting RSS (lazy: no model)
+#   prewarm   - import + model_store.prewarm(), i.e. what WAF_PREWARM=1 or the
+#               first scoring request costs; this is what every import paid
+#               before the model was loaded lazily
+#   first     - import + one /analyze-request scoring call
+#
+#   python benchmarks/bench_startup.py [--runs N]
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+CHILD = r"""
+import json, resource, sys, time, warnings
+warnings.filterwarnings("ignore")
+sys.path.insert(0, {backend!r})
+start = time.perf_counter()
+import app
+stage = {stage!r}
+if stage == "prewarm":
+    import model_store
+    model_store.prewarm()
+elif stage == "first":
+    app.predict_from_features(app.extract_features("/search?q=1' or 1=1--", "", {{}}))
+elapsed = time.perf_counter() - start
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+heavy = sorted(m for m in ("numpy", "sklearn", "joblib", "requests") if m in sys.modules)
+print(json.dumps({{"seconds": elapsed, "rss_mb": rss_mb, "heavy": heavy}}))
+"""
+
+
+def sample(stage, cwd):
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(backend=str(BACKEND), stage=stage)],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API cold-start time and RSS.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    # Run from an empty directory: importing app must not create files there.
+    with tempfile.TemporaryDirectory() as cwd:
+        print(f"{'stage':<10}{'median ms':>12}{'max RSS MB':>12}  heavy modules loaded")
+        for stage in ("import", "prewarm", "first"):
+            runs = [sample(stage, cwd) for _ in range(args.runs)]
+            ms = statistics.median(r["seconds"] for r in runs) * 1000
+            rss = max(r["rss_mb"] for r in runs)
+            print(f"{stage:<10}{ms:>12.1f}{rss:>12.1f}  {', '.join(runs[0]['heavy']) or '-'}")
+        leftovers = list(Path(cwd).iterdir())
+        if leftovers:
+            print("import side effects:", ", ".join(p.name for p in leftovers))
+
+
+if __name__ == "__main__":
+    main()
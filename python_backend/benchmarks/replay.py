@@ -0,0 +1,385 @@
+# replay.py
+#
+# Offline traffic replay against the WAF proxy, for correctness and
+# performance regression testing from one captured traffic file.
+#
+# Requests are streamed (never loaded as a whole) from a Burp Suite XML export
+# (parsed with model_training/log_parser.py) or from the logs1 table of waf.db,
+# read in pages and only up to the rows present at start, re-targeted
+# at a local mock upstream and sent through the proxy over many concurrent
+# connections, either
+#
+#   - with the original inter-arrival times     (--speed 1)
+#   - with the original timing sped up N times  (--speed N)
+#   - as fast as possible                       (--speed 0, the default)
+#
+# For every request the proxy verdict (403 + "blocked" = blocked, 503 + "shed"
+# = shed by the load controller, anything else = forwarded) is compared with
+# the logged verdict (logs1.malicious / status; rows logged as "monitored" were
+# forwarded; Burp captures carry none) and the latency is recorded. Shed
+# requests are reported but not compared.
+#
+# Timing starts after one untimed warm-up request, so the lazy model load and
+# the first-request imports are not reported as latency. With --start-proxy
+# the model is also prewarmed, and the in-process proxy logs to a temporary
+# database, so replaying waf.db never appends to the table it reads from.
+#
+#   python benchmarks/replay.py --db waf.db --start-proxy
+#   python benchmarks/replay.py --burp ../model_training/burpsuite_sample_log.log --speed 10
+#   python benchmarks/replay.py --db waf.db --json result.json --max-p99-ms 50 --min-parity 0.99
+import argparse
+import http.client
+import http.server
+import itertools
+import json
+import queue
+import socketserver
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(BACKEND.parent / "model_training"))
+
+DB_PAGE_SIZE = 500
+
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-connection", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+
+# ---------- Sources ----------
+
+def _burp_time(value):
+    # "Tue Nov 18 12:26:36 IST 2025": drop the zone name, strptime cannot read it
+    try:
+        parts = value.split()
+        return datetime.strptime(" ".join(parts[:4] + parts[5:]), "%a %b %d %H:%M:%S %Y").timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def _iso_time(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_burp(log_path, limit=None):
+    from log_parser import iter_log_items, parse_log
+
+    items = (parse_log(item["request"]) | {"time": item["time"]} for item in iter_log_items(log_path))
+    for request in itertools.islice((r for r in items if r["method"]), limit):
+        yield {
+            "time": _burp_time(request["time"]),
+            "method": request["method"],
+            "url": request["path"],
+            "headers": request["headers"],
+            "body": request["body"],
+            "expected": None,
+        }
+
+
+def _expected(malicious, status):
+    # monitor-only routes log detections as "monitored" and still forward them
+    if status == "monitored":
+        return "forwarded"
+    return "blocked" if (malicious or status == "blocked") else "forwarded"
+
+
+def iter_db(db_path, limit=None, page_size=DB_PAGE_SIZE):
+    """
+    Rows of logs1 in time order, fetched a page at a time so no read lock is
+    held while a proxy logs into the same file. Rows added after the start
+    (e.g. by the replay itself) are not replayed.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        (last_rowid,) = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM logs1").fetchone()
+        sql = ("SELECT rowid, method, url, body, headers, malicious, status, created_at FROM logs1 "
+               "WHERE rowid <= ? AND (COALESCE(created_at, ''), rowid) > (?, ?) "
+               "ORDER BY COALESCE(created_at, ''), rowid LIMIT ?")
+        position, remaining = ("", 0), limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            page = conn.execute(sql, (last_rowid, *position, size)).fetchall()
+            if not page:
+                break
+            for rowid, method, url, body, headers, malicious, status, created_at in page:
+                try:
+                    headers = json.loads(headers) if headers else {}
+                except json.JSONDecodeError:
+                    headers = {}
+                yield {
+                    "time": _iso_time(created_at),
+                    "method": method,
+                    "url": url,
+                    "headers": headers,
+                    "body": body or "",
+                    "expected": _expected(malicious, status),
+                }
+            position = (page[-1][7] or "", page[-1][0])
+            if remaining is not None:
+                remaining -= len(page)
+    finally:
+        conn.close()
+
+
+def schedule(requests, speed):
+    """Attach a send offset (seconds after the first timed request) to each request, lazily."""
+    first = None
+    for request in requests:
+        if first is None:
+            first = request["time"]
+        if speed <= 0 or first is None or request["time"] is None:
+            request["offset"] = 0.0
+        else:
+            request["offset"] = max(request["time"] - first, 0.0) / speed
+        yield request
+
+
+# ---------- Mock upstream ----------
+
+class MockUpstream(http.server.BaseHTTPRequestHandler):
+    """Answers every request with a small 200 so only the proxy's cost is measured."""
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_upstream(host="127.0.0.1", port=0):
+    server = socketserver.ThreadingTCPServer((host, port), MockUpstream)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ---------- Replay ----------
+
+def _retarget(url, upstream):
+    parts = urllib.parse.urlsplit(url or "/")
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return f"http://{upstream}{path}"
+
+
+def _send(conn, request, upstream):
+    body = request["body"].encode("utf-8") if request["body"] else None
+    headers = {k: v for k, v in request["headers"].items() if k.lower() not in HOP_BY_HOP}
+    start = time.perf_counter()
+    conn.request(request["method"], _retarget(request["url"], upstream), body=body, headers=headers)
+    response = conn.getresponse()
+    payload = response.read()
+    latency = time.perf_counter() - start
+
+    verdict = "forwarded"
+    if response.status in (403, 503):
+        try:
+            status = json.loads(payload).get("status")
+        except (ValueError, AttributeError):
+            status = None
+        if response.status == 403 and status == "blocked":
+            verdict = "blocked"
+        elif response.status == 503 and status == "shed":
+            verdict = "shed"
+    return response.status, verdict, latency
+
+
+def warm_up(request, proxy_host, proxy_port, upstream, timeout):
+    """One untimed request through the proxy (model load, first-request imports)."""
+    conn = http.client.HTTPConnection(proxy_host, proxy_port, timeout=timeout)
+    try:
+        _send(conn, request, upstream)
+    except (OSError, http.client.HTTPException) as exc:
+        print("[!] Warm-up request failed:", exc)
+    finally:
+        conn.close()
+
+
+def replay(requests, proxy_host, proxy_port, upstream, concurrency, timeout):
+    work = queue.Queue(maxsize=concurrency * 4)
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        conn = http.client.HTTPConnection(proxy_host, proxy_port, timeout=timeout)
+        while True:
+            request = work.get()
+            if request is None:
+                break
+            try:
+                status, verdict, latency = _send(conn, request, upstream)
+                result = {"status": status, "verdict": verdict, "latency": latency}
+            except (OSError, http.client.HTTPException) as exc:
+                conn.close()
+                result = {"status": None, "verdict": None, "latency": None, "error": str(exc)}
+            result.update(method=request["method"], url=request["url"], expected=request["expected"])
+            with lock:
+                results.append(result)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    started = time.perf_counter()
+    for request in requests:
+        delay = request["offset"] - (time.perf_counter() - started)
+        if delay > 0:
+            time.sleep(delay)
+        work.put(request)
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(results, elapsed):
+    latencies = sorted(r["latency"] * 1000 for r in results if r["latency"] is not None)
+    compared = [r for r in results if r["expected"] and r["verdict"] in ("blocked", "forwarded")]
+    mismatches = [r for r in compared if r["verdict"] != r["expected"]]
+    return {
+        "requests": len(results),
+        "errors": sum(1 for r in results if r.get("error")),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(results) / elapsed if elapsed else None,
+        "latency_ms": {
+            "mean": statistics.fmean(latencies) if latencies else None,
+            "p50": _percentile(latencies, 50),
+            "p90": _percentile(latencies, 90),
+            "p99": _percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        },
+        "verdicts": {
+            "blocked": sum(1 for r in results if r["verdict"] == "blocked"),
+            "forwarded": sum(1 for r in results if r["verdict"] == "forwarded"),
+            "shed": sum(1 for r in results if r["verdict"] == "shed"),
+        },
+        "parity": {
+            "compared": len(compared),
+            "matching": len(compared) - len(mismatches),
+            "ratio": (len(compared) - len(mismatches)) / len(compared) if compared else None,
+            "mismatches": [
+                {"method": r["method"], "url": r["url"], "expected": r["expected"], "got": r["verdict"]}
+                for r in mismatches[:20]
+            ],
+        },
+    }
+
+
+def print_summary(summary):
+    lat = summary["latency_ms"]
+    fmt = lambda v: "-" if v is None else f"{v:.2f}"  # noqa: E731
+    print(f"requests: {summary['requests']}  errors: {summary['errors']}  "
+          f"elapsed: {summary['elapsed_s']:.2f}s  throughput: {fmt(summary['throughput_rps'])} req/s")
+    print(f"latency ms: mean {fmt(lat['mean'])}  p50 {fmt(lat['p50'])}  p90 {fmt(lat['p90'])}  "
+          f"p99 {fmt(lat['p99'])}  max {fmt(lat['max'])}")
+    verdicts = summary["verdicts"]
+    print(f"verdicts: {verdicts['blocked']} blocked, {verdicts['forwarded']} forwarded, {verdicts['shed']} shed")
+    parity = summary["parity"]
+    if parity["compared"]:
+        print(f"parity: {parity['matching']}/{parity['compared']} ({parity['ratio']:.2%}) match the logged verdict")
+        for m in parity["mismatches"][:5]:
+            print(f"  {m['method']} {m['url'][:100]}  expected {m['expected']}, got {m['got']}")
+    else:
+        print("parity: no logged verdicts in this source")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic through the WAF proxy.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--burp", help="Burp Suite XML export")
+    source.add_argument("--db", help="SQLite database with the logs1 table")
+    parser.add_argument("--limit", type=int, help="replay at most N requests")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="1 = original timing, N = N times faster, 0 = maximum rate")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--proxy", default="127.0.0.1:8888", help="proxy host:port")
+    parser.add_argument("--start-proxy", action="store_true", help="start proxy_server in this process")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="write the summary as JSON")
+    parser.add_argument("--max-p99-ms", type=float, help="exit non-zero if p99 latency is higher")
+    parser.add_argument("--min-parity", type=float, help="exit non-zero if verdict parity is lower (0..1)")
+    args = parser.parse_args()
+
+    source = iter_burp(args.burp, args.limit) if args.burp else iter_db(args.db, args.limit)
+    requests = schedule(source, args.speed)
+    first = next(requests, None)
+
+    upstream = start_mock_upstream()
+    upstream_addr = "%s:%d" % upstream.server_address
+    proxy_host, _, proxy_port = args.proxy.rpartition(":")
+
+    scratch = None
+    if args.start_proxy:
+        import model_store
+        import proxy_server
+
+        scratch = tempfile.TemporaryDirectory(prefix="waf-replay-")
+        proxy_server.DB_PATH = str(Path(scratch.name) / "replay.db")
+        model_store.prewarm()
+        proxy_server.start_proxy()
+        time.sleep(0.5)
+
+    try:
+        if first is not None:
+            warm_up(first, proxy_host, int(proxy_port), upstream_addr, args.timeout)
+            requests = itertools.chain([first], requests)
+        results, elapsed = replay(requests, proxy_host, int(proxy_port), upstream_addr,
+                                  args.concurrency, args.timeout)
+    finally:
+        if args.start_proxy:
+            proxy_server.stop_proxy()
+            scratch.cleanup()
+        upstream.shutdown()
+
+    summary = summarize(results, elapsed)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    failed = False
+    p99 = summary["latency_ms"]["p99"]
+    if args.max_p99_ms is not None and (p99 is None or p99 > args.max_p99_ms):
+        print(f"[!] p99 latency {p99} ms exceeds {args.max_p99_ms} ms")
+        failed = True
+    ratio = summary["parity"]["ratio"]
+    if args.min_parity is not None and ratio is not None and ratio < args.min_parity:
+        print(f"[!] verdict parity {ratio:.2%} below {args.min_parity:.2%}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
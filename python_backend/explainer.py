@@ -0,0 +1,198 @@
+"""
+Per-feature explanation of forest verdicts by tree-path decomposition.
+
+For a decision tree, the predicted probability at a leaf equals the root
+probability plus, for every split on the way down, the change in probability
+caused by that split. Attributing each change to the feature the split tests
+gives an exact additive breakdown:
+
+    p(malicious) = base + sum(contribution[feature])
+
+averaged over the trees of the forest. Everything that does not depend on
+the request (the path sums for every node) is computed once when the model
+is loaded, and the forest is flattened into a few numpy arrays so one
+request is scored by walking all trees at once, level by level. Results are
+cached by feature tuple; the base feature space is six small integers and
+repeats heavily in real traffic.
+
+numpy is imported when an explainer is built, so the formatting helpers can
+be imported by the API and the proxy without pulling it in at startup.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple
+
+EXPLANATION_CACHE_SIZE = 4096
+
+
+# Flat arrays that fully describe a scoring forest (see flatten_forest).
+ARRAY_FIELDS = ("roots", "feature", "threshold", "left", "right", "path_contributions")
+
+
+def flatten_forest(model: Any, n_features: int, target_class: Any = 0) -> Dict[str, Any]:
+    """
+    Flatten a fitted tree / forest into the arrays of ``ARRAY_FIELDS`` plus
+    ``base_value`` and ``max_depth``. Node ids are global across trees; leaves
+    point to themselves so every tree can take the same number of steps.
+    """
+    import numpy as np
+
+    estimators = getattr(model, "estimators_", None) or [model]
+    if not all(hasattr(est, "tree_") for est in estimators):
+        raise TypeError("TreePathExplainer needs a tree or a forest of trees")
+    class_index = list(model.classes_).index(target_class)
+
+    features, thresholds, lefts, rights, probs, parents = [], [], [], [], [], []
+    roots = []
+    offset = 0
+    for est in estimators:
+        tree = est.tree_
+        n = tree.node_count
+        values = tree.value[:, 0, :]
+        values = values / values.sum(axis=1, keepdims=True)
+        left = tree.children_left.astype(np.int64)
+        right = tree.children_right.astype(np.int64)
+        is_leaf = left < 0
+        ids = np.arange(n, dtype=np.int64)
+        parent = np.full(n, -1, dtype=np.int64)
+        parent[left[~is_leaf]] = ids[~is_leaf]
+        parent[right[~is_leaf]] = ids[~is_leaf]
+
+        roots.append(offset)
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(np.where(is_leaf, ids, left) + offset)
+        rights.append(np.where(is_leaf, ids, right) + offset)
+        probs.append(values[:, class_index])
+        parents.append(np.where(parent < 0, -1, parent + offset))
+        offset += n
+
+    feature = np.concatenate(features).astype(np.int32)
+    prob = np.concatenate(probs).astype(np.float64)
+    parent = np.concatenate(parents)
+    roots = np.array(roots, dtype=np.int32)
+    return {
+        "roots": roots,
+        "feature": feature,
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "left": np.concatenate(lefts).astype(np.int32),
+        "right": np.concatenate(rights).astype(np.int32),
+        "path_contributions": _path_contributions(prob, parent, feature, n_features),
+        "base_value": float(prob[roots].mean()),
+        "max_depth": max(int(est.tree_.max_depth) for est in estimators),
+    }
+
+
+def _path_contributions(prob: Any, parent: Any, feature: Any, n_features: int) -> Any:
+    """Sum of split contributions from the root down to every node, shape (nodes, features)."""
+    import numpy as np
+
+    n_nodes = len(prob)
+    contributions = np.zeros((n_nodes, n_features), dtype=np.float64)
+    depth = np.zeros(n_nodes, dtype=np.int64)
+    # Children always have larger ids than their parent, so one forward sweep assigns depths.
+    for node in np.flatnonzero(parent >= 0):
+        depth[node] = depth[parent[node]] + 1
+    for level in range(1, int(depth.max(initial=0)) + 1):
+        nodes = np.flatnonzero(depth == level)
+        up = parent[nodes]
+        contributions[nodes] = contributions[up]
+        np.add.at(contributions, (nodes, feature[up]), prob[nodes] - prob[up])
+    return contributions
+
+
+class TreePathExplainer:
+    """Flattened forest that returns the target-class probability together with its breakdown."""
+
+    def __init__(
+        self,
+        model: Any,
+        feature_names: Sequence[str],
+        target_class: Any = 0,
+        cache_size: int = EXPLANATION_CACHE_SIZE,
+    ):
+        arrays = flatten_forest(model, len(feature_names), target_class)
+        self._setup(feature_names, arrays, cache_size)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        feature_names: Sequence[str],
+        arrays: Dict[str, Any],
+        cache_size: int = EXPLANATION_CACHE_SIZE,
+    ) -> "TreePathExplainer":
+        """Build from ``flatten_forest`` output, e.g. arrays mapped from a model artifact."""
+        explainer = cls.__new__(cls)
+        explainer._setup(feature_names, arrays, cache_size)
+        return explainer
+
+    def _setup(self, feature_names: Sequence[str], arrays: Dict[str, Any], cache_size: int) -> None:
+        self.feature_names = list(feature_names)
+        for name in ARRAY_FIELDS:
+            setattr(self, name, arrays[name])
+        self.n_trees = len(self.roots)
+        self.base_value = float(arrays["base_value"])
+        self.max_depth = int(arrays["max_depth"])
+        self._explain_cached = lru_cache(maxsize=cache_size)(self._explain)
+
+    def leaves(self, vector: Sequence[float]) -> Any:
+        """Leaf reached in every tree (global node ids), with sklearn's float32 split semantics."""
+        import numpy as np
+
+        x = np.asarray(vector, dtype=np.float32).astype(np.float64)
+        node = self.roots
+        for _ in range(self.max_depth):
+            go_left = x[self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def _explain(self, key: Tuple[float, ...]) -> Tuple[float, Tuple[float, ...]]:
+        contributions = self.path_contributions[self.leaves(key)].mean(axis=0)
+        probability = self.base_value + float(contributions.sum())
+        return probability, tuple(float(c) for c in contributions)
+
+    def explain(self, vector: Sequence[float]) -> Dict[str, Any]:
+        """
+        Target-class probability plus its additive breakdown for one feature vector.
+
+        ``baseValue + sum(contributions.values()) == probability`` up to float rounding.
+        """
+        probability, contributions = self._explain_cached(tuple(vector))
+        return {
+            "probability": min(max(probability, 0.0), 1.0),
+            "baseValue": self.base_value,
+            "contributions": dict(zip(self.feature_names, contributions)),
+        }
+
+    def cache_info(self):
+        return self._explain_cached.cache_info()
+
+
+def top_contributions(
+    explanation: Dict[str, Any], features: Dict[str, Any], limit: int = 3
+) -> List[Dict[str, Any]]:
+    """Contributions sorted by magnitude, with the feature values that produced them."""
+    ranked = sorted(explanation["contributions"].items(), key=lambda kv: abs(kv[1]), reverse=True)
+    return [
+        {"feature": name, "value": features.get(name), "contribution": round(value, 4)}
+        for name, value in ranked[:limit]
+    ]
+
+
+def describe(explanation: Dict[str, Any], features: Dict[str, Any], limit: int = 3) -> str:
+    """One-line, human readable summary of the strongest contributions."""
+    parts = [
+        f"{item['feature']}={item['value']} ({item['contribution']:+.3f})"
+        for item in top_contributions(explanation, features, limit)
+        if item["contribution"]
+    ]
+    base = f"base rate {explanation['baseValue']:.3f}"
+    return f"{base}; " + ", ".join(parts) if parts else base
+
+
+def build_explainer(model: Any, feature_names: Sequence[str], target_class: Any = 0):
+    """TreePathExplainer for tree models, ``None`` for anything else."""
+    try:
+        return TreePathExplainer(model, feature_names, target_class)
+    except (TypeError, AttributeError, ValueError):
+        return None
@@ -0,0 +1,512 @@
+"""
+Asynchronous export of proxy verdicts for SIEM ingestion.
+
+The proxy publishes one event per inspected request (the same record it
+broadcasts to the dashboard, with the final status). ``publish`` only
+appends to the queue of every configured sink and never waits. Queues are
+bounded by event count and by the approximate size of what they hold
+(``WAF_EXPORT_QUEUE_MB``, default 64), since one event can carry a body of up
+to ``proxy_server.MAX_BODY_BYTES``. When a queue is full the event is
+dropped and counted, as are the events of a batch the sink failed to write.
+Each sink drains its queue on its own background thread, in batches.
+
+Sinks, configured from the environment:
+
+* ``WAF_EXPORT_DIR``  - rotated, compressed files in that directory:
+  gzip JSONL (``WAF_EXPORT_FORMAT=jsonl``, the default) or Parquet
+  (``parquet``, needs pyarrow). A file is rotated when it reaches
+  ``WAF_EXPORT_ROTATE_MB`` (default 64) or is ``WAF_EXPORT_ROTATE_SECONDS``
+  old (default 3600). Files are written as ``*.part`` and renamed when
+  complete, so collectors only ever pick up finished files.
+* ``WAF_EXPORT_SYSLOG`` - ``host:port`` of a syslog collector; every event
+  is sent as one RFC 5424 UDP datagram with a JSON message. Events larger
+  than a datagram lose their body, headers, explanation and url, in that
+  order, until they fit (listed in ``"truncated"``); an event that still does
+  not fit is dropped and counted, never cut mid-message.
+
+With neither set, ``publish`` is a no-op. For local testing::
+
+    python exporter.py receive --port 5514      # prints what the proxy sends
+"""
+
+import argparse
+import gzip
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+QUEUE_SIZE = 10000
+QUEUE_BYTES = int(float(os.environ.get("WAF_EXPORT_QUEUE_MB", 64)) * 1024 * 1024)
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+ROTATE_BYTES = int(float(os.environ.get("WAF_EXPORT_ROTATE_MB", 64)) * 1024 * 1024)
+ROTATE_SECONDS = float(os.environ.get("WAF_EXPORT_ROTATE_SECONDS", 3600))
+EXPORT_FORMATS = ("jsonl", "parquet")
+
+SYSLOG_FACILITY = 16  # local0
+SYSLOG_MAX_DATAGRAM = 8192
+SEVERITY_WARNING = 4
+SEVERITY_INFO = 6
+# unbounded fields removed, in this order, from events too large for one datagram
+SYSLOG_TRIM_FIELDS = ("body", "headers", "explanation", "url")
+
+# Flat columns of the Parquet schema; nested fields are stored as JSON strings.
+RECORD_FIELDS = (
+    "id", "created_at", "method", "url", "status", "malicious", "malicious_prob",
+    "rule", "action", "threshold", "fail_mode", "degraded", "shed_reason",
+    "body", "headers", "explanation",
+)
+
+
+class ExportError(ValueError):
+    """The export configuration is invalid (unknown format, missing pyarrow, bad address)."""
+
+
+def flatten(event: Dict[str, Any]) -> Dict[str, Any]:
+    """One event as a flat record with the columns of ``RECORD_FIELDS``."""
+    policy = event.get("policy") or {}
+    shed = event.get("shed") or {}
+    explanation = event.get("explanation")
+    threshold = policy.get("threshold")
+    return {
+        "id": event.get("id"),
+        "created_at": event.get("created_at"),
+        "method": event.get("method"),
+        "url": event.get("url"),
+        "status": event.get("status"),
+        "malicious": bool(event.get("malicious")),
+        "malicious_prob": float(event.get("malicious_prob") or 0.0),
+        "rule": policy.get("rule"),
+        "action": policy.get("action"),
+        "threshold": None if threshold is None else float(threshold),
+        "fail_mode": shed.get("fail_mode") or policy.get("fail_mode"),
+        "degraded": bool(event.get("degraded") or shed),
+        "shed_reason": shed.get("reason"),
+        "body": event.get("body"),
+        "headers": json.dumps(event.get("headers") or {}),
+        "explanation": json.dumps(explanation) if explanation else None,
+    }
+
+
+def event_size(value: Any) -> int:
+    """Approximate in-memory size of an event, counting its strings; used to bound the queues."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + event_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(map(event_size, value))
+    return 8
+
+
+class Sink:
+    """
+    A bounded queue drained in batches by one background thread.
+
+    Subclasses implement ``write_batch``, which may return how many events of
+    the batch it actually wrote (the rest count as dropped), and optionally
+    ``tick``, called at least every flush interval, and ``finish``, called
+    once on close.
+    """
+
+    name = "sink"
+
+    def __init__(self, queue_size: int = QUEUE_SIZE, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, queue_bytes: int = QUEUE_BYTES):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_bytes = queue_bytes
+        self.queue: "queue.Queue[Optional[Tuple[int, Dict[str, Any]]]]" = queue.Queue(maxsize=queue_size)
+        self.queued_bytes = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._closed = False
+        self._abandoned = False
+        self._drop_lock = threading.Lock()  # guards dropped and queued_bytes
+        self._thread = threading.Thread(target=self._run, name=f"export-{self.name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, event: Dict[str, Any]) -> bool:
+        """Queue one event without blocking. Returns False if it was dropped."""
+        if self._closed:
+            return False
+        size = event_size(event)
+        with self._drop_lock:
+            if self.queued_bytes + size > self.queue_bytes:
+                self.dropped += 1
+                return False
+            self.queued_bytes += size
+        try:
+            self.queue.put_nowait((size, event))
+            return True
+        except queue.Full:
+            with self._drop_lock:
+                self.queued_bytes -= size
+                self.dropped += 1
+            return False
+
+    def _run(self) -> None:
+        stop = False
+        while not stop and not self._abandoned:
+            batch: List[Dict[str, Any]] = []
+            batch_bytes = 0
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch_bytes += item[0]
+                batch.append(item[1])
+            with self._drop_lock:
+                self.queued_bytes -= batch_bytes
+            try:
+                if batch:
+                    written = self.write_batch(batch)
+                    written = len(batch) if written is None else written
+                    self.written += written
+                    with self._drop_lock:
+                        self.dropped += len(batch) - written
+                self.tick()
+            except Exception as exc:
+                # the batch is lost: count it as dropped, not only as an error
+                with self._drop_lock:
+                    self.dropped += len(batch)
+                self.errors += 1
+                self.last_error = str(exc)
+                print(f"Export sink {self.name} failed:", exc)
+        try:
+            self.finish()
+        except Exception as exc:
+            self.errors += 1
+            self.last_error = str(exc)
+            print(f"Export sink {self.name} failed to close:", exc)
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> Optional[int]:
+        raise NotImplementedError
+
+    def tick(self) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write what is queued, finish the current file and stop the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            # the writer is stuck: give up on what is queued rather than hang shutdown
+            self._abandoned = True
+            with self._drop_lock:
+                self.dropped += self.queue.qsize()
+            print(f"Export sink {self.name} did not drain in {timeout:.0f}s; dropping its queue")
+            return
+        self._thread.join(max(deadline - time.monotonic(), 0.0))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sink": self.name,
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "queued_bytes": self.queued_bytes,
+            "capacity_bytes": self.queue_bytes,
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+class FileSink(Sink):
+    """Rotated gzip JSONL or Parquet files in one directory."""
+
+    name = "file"
+
+    def __init__(self, directory: Path, fmt: str = "jsonl", rotate_bytes: int = ROTATE_BYTES,
+                 rotate_seconds: float = ROTATE_SECONDS, prefix: str = "waf", **kwargs: Any):
+        if fmt not in EXPORT_FORMATS:
+            raise ExportError(f"unknown export format {fmt!r} (expected one of {', '.join(EXPORT_FORMATS)})")
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ExportError("parquet export needs pyarrow (pip install pyarrow)") from None
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.format = fmt
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.prefix = prefix
+        self.files = 0
+        self._path: Optional[Path] = None
+        self._opened = 0.0
+        self._raw: Any = None
+        self._writer: Any = None
+        self._sequence = 0
+        super().__init__(**kwargs)
+
+    # ---------- current file ----------
+
+    def _open(self) -> None:
+        self._sequence += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        suffix = ".jsonl.gz" if self.format == "jsonl" else ".parquet"
+        self._path = self.directory / f"{self.prefix}-{stamp}-{os.getpid()}-{self._sequence:04d}{suffix}"
+        self._opened = time.monotonic()
+        self._raw = open(self._path.with_name(self._path.name + ".part"), "wb")
+        if self.format == "jsonl":
+            self._writer = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+
+    def _rotate(self) -> None:
+        if self._raw is None:
+            return
+        if self._writer is not None:
+            self._writer.close()
+        self._raw.close()
+        part = self._path.with_name(self._path.name + ".part")
+        part.rename(self._path)
+        self.files += 1
+        self._raw = self._writer = self._path = None
+
+    def _parquet_writer(self, table: Any) -> Any:
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._raw, table.schema, compression="zstd")
+        return self._writer
+
+    # ---------- Sink ----------
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> Optional[int]:
+        if self._raw is None:
+            self._open()
+        if self.format == "jsonl":
+            lines = "".join(json.dumps(event, default=str) + "\n" for event in batch)
+            self._writer.write(lines.encode("utf-8"))
+            self._writer.flush()
+        else:
+            import pyarrow as pa
+
+            records = [flatten(event) for event in batch]
+            table = pa.Table.from_pylist(records, schema=_parquet_schema())
+            self._parquet_writer(table).write_table(table)
+        if self._raw.tell() >= self.rotate_bytes:
+            self._rotate()
+
+    def tick(self) -> None:
+        if self._raw is not None and time.monotonic() - self._opened >= self.rotate_seconds:
+            self._rotate()
+
+    def finish(self) -> None:
+        self._rotate()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update(format=self.format, directory=str(self.directory), files=self.files,
+                     current=self._path.name if self._path else None)
+        return stats
+
+
+def _parquet_schema() -> Any:
+    import pyarrow as pa
+
+    types = {"malicious": pa.bool_(), "malicious_prob": pa.float64(), "threshold": pa.float64(),
+             "degraded": pa.bool_()}
+    return pa.schema([(name, types.get(name, pa.string())) for name in RECORD_FIELDS])
+
+
+def parse_address(value: str, default_port: int = 514) -> Tuple[str, int]:
+    host, sep, port = value.rpartition(":")
+    if not sep:
+        return value, default_port
+    try:
+        return host or "127.0.0.1", int(port)
+    except ValueError:
+        raise ExportError(f"invalid address {value!r}, expected host:port") from None
+
+
+class SyslogSink(Sink):
+    """RFC 5424 messages over UDP, one event per datagram, the event as JSON in the message."""
+
+    name = "syslog"
+
+    def __init__(self, address: Tuple[str, int], facility: int = SYSLOG_FACILITY,
+                 app_name: str = "ai-waf", **kwargs: Any):
+        self.address = address
+        self.facility = facility
+        self.app_name = app_name
+        self.hostname = socket.gethostname() or "-"
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        super().__init__(**kwargs)
+
+    def encode(self, event: Dict[str, Any]) -> Optional[bytes]:
+        """One datagram, or None if the event does not fit even without its unbounded fields."""
+        severity = SEVERITY_WARNING if event.get("malicious") else SEVERITY_INFO
+        timestamp = (event.get("created_at") or datetime.utcnow().isoformat()) + "Z"
+        header = (f"<{self.facility * 8 + severity}>1 {timestamp} {self.hostname} "
+                  f"{self.app_name} {os.getpid()} {event.get('status') or '-'} - ").encode("utf-8")
+        room = SYSLOG_MAX_DATAGRAM - len(header)
+        message = json.dumps(event, default=str).encode("utf-8")
+        trimmed: List[str] = []
+        for field in SYSLOG_TRIM_FIELDS:
+            if len(message) <= room:
+                break
+            if event.get(field) is None:
+                continue
+            trimmed.append(field)
+            event = dict(event, **{field: None}, truncated=trimmed)
+            message = json.dumps(event, default=str).encode("utf-8")
+        if len(message) > room:
+            return None
+        return header + message
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> Optional[int]:
+        written = 0
+        for event in batch:
+            datagram = self.encode(event)
+            if datagram is not None:
+                self._socket.sendto(datagram, self.address)
+                written += 1
+        return written
+
+    def finish(self) -> None:
+        self._socket.close()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["address"] = "%s:%d" % self.address
+        return stats
+
+
+class Exporter:
+    """Fans every published event out to its sinks."""
+
+    def __init__(self, sinks: Optional[List[Sink]] = None):
+        self.sinks = list(sinks or [])
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        for sink in self.sinks:
+            sink.submit(event)
+
+    def close(self, timeout: float = 5.0) -> None:
+        for sink in self.sinks:
+            sink.close(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": bool(self.sinks), "sinks": [sink.stats() for sink in self.sinks]}
+
+
+def from_environment() -> Exporter:
+    sinks: List[Sink] = []
+    directory = os.environ.get("WAF_EXPORT_DIR")
+    if directory:
+        sinks.append(FileSink(Path(directory), os.environ.get("WAF_EXPORT_FORMAT", "jsonl").lower()))
+    syslog = os.environ.get("WAF_EXPORT_SYSLOG")
+    if syslog:
+        sinks.append(SyslogSink(parse_address(syslog)))
+    return Exporter(sinks)
+
+
+_exporter: Optional[Exporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter() -> Exporter:
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = from_environment()
+    return _exporter
+
+
+def close_exporter() -> None:
+    global _exporter
+    with _exporter_lock:
+        if _exporter is not None:
+            _exporter.close()
+            _exporter = None
+
+
+# ---------- Stub receiver ----------
+
+class SyslogReceiver:
+    """Collects the datagrams sent to a local UDP port; a stand-in collector for tests."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.2)
+        self.address = self._socket.getsockname()
+        self.messages: "queue.Queue[bytes]" = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="syslog-receiver", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                data, _ = self._socket.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.messages.put(data)
+
+    @staticmethod
+    def parse(datagram: bytes) -> Tuple[int, Dict[str, Any]]:
+        """(priority, event) of one datagram sent by SyslogSink."""
+        text = datagram.decode("utf-8")
+        priority = int(text[1:text.index(">")])
+        return priority, json.loads(text[text.index(" - ") + 3:])
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._thread.join(1.0)
+        self._socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WAF export tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    receive = sub.add_parser("receive", help="print the syslog datagrams sent to a local UDP port")
+    receive.add_argument("--host", default="127.0.0.1")
+    receive.add_argument("--port", type=int, default=5514)
+    args = parser.parse_args()
+
+    receiver = SyslogReceiver(args.host, args.port)
+    print("[+] Listening on %s:%d (set WAF_EXPORT_SYSLOG to this address)" % receiver.address)
+    try:
+        while True:
+            try:
+                datagram = receiver.messages.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            priority, event = SyslogReceiver.parse(datagram)
+            print(f"<{priority}> {event.get('status')} {event.get('method')} {event.get('url')} "
+                  f"p={event.get('malicious_prob')}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Request feature extraction shared by the proxy, the API and model training.
+
+All text is first passed through ``normalizer.normalize`` (bounded
+URL/HTML/unicode decoding and case folding), so the three callers count
+features on exactly the same string.
+
+Two feature sets are exposed:
+
+* ``base``     - the six legacy counts every shipped model was trained on.
+* ``extended`` - the base counts plus per-category keyword counts,
+                 character-class ratios, entropy, length, encoding depth and
+                 header anomaly features.
+
+The extended scan is linear in the payload size: one byte histogram (which
+yields every character-class ratio and the entropy) and one ``str.count`` per
+distinct token, shared by the base counts, the bad words and the attack
+keyword categories, over the whole payload. Only the histogram is capped, at
+``MAX_INSPECT_BYTES``. The cost is budgeted as a fixed per-request part
+(``COST_BUDGET_US_PER_REQUEST``) plus a marginal part per inspected KB
+(``COST_BUDGET_US_PER_KB``); ``model_training/train_model.py`` measures both
+feature sets against it and ``--check-budget`` fails the run when either is
+exceeded. The proxy bounds the total work per request by refusing bodies
+above ``proxy_server.MAX_BODY_BYTES``.
+"""
+
+from collections import Counter
+from functools import lru_cache
+from math import log2
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from normalizer import Payload, normalize
+
+BASE_FEATURES = ("single_q", "double_q", "dashes", "braces", "spaces", "badwords")
+
+EXTENDED_FEATURES = BASE_FEATURES + (
+    "sqli_kw", "xss_kw", "cmdi_kw", "lfi_kw",
+    "length", "digit_ratio", "alpha_ratio", "space_ratio", "special_ratio", "nonprint_ratio",
+    "entropy", "encoding_depth",
+    "hdr_count", "hdr_missing_ua", "hdr_badwords", "hdr_max_len",
+)
+
+FEATURE_SETS = {
+    "base": BASE_FEATURES,
+    "extended": EXTENDED_FEATURES,
+}
+
+BAD_WORDS = [
+    "sleep", "drop", "uid", "select", "waitfor", "delay",
+    "system", "union", "order by", "group by",
+    "insert", "update", "delete", "benchmark",
+    "and 1=1", "or 1=1", "--", "#"
+]
+
+# Every keyword belongs to exactly one category.
+CATEGORY_KEYWORDS = {
+    "sqli_kw": ["select", "union", "drop", "insert", "update", "' or", "' and",
+                "sleep(", "waitfor", "benchmark", "order by", "group by", "--"],
+    "xss_kw": ["<script", "onerror", "onload", "alert(", "document.cookie", "javascript:", "<iframe", "<svg"],
+    "cmdi_kw": ["; rm", "&&", "||", "$(", "`", "chmod", "cat /", "curl ", "wget ", "/bin/sh", "|"],
+    "lfi_kw": ["../", "..\\", "/etc/passwd", "system32", "php://", "file://"],
+}
+
+# Only the byte histogram (ratios, entropy, length) is sampled; every count
+# is taken over the whole normalised payload.
+MAX_INSPECT_BYTES = 64 * 1024
+COST_BUDGET_US_PER_REQUEST = 50.0
+COST_BUDGET_US_PER_KB = 100.0
+
+_KEYWORD_CATEGORY = {
+    keyword: category
+    for category, keywords in CATEGORY_KEYWORDS.items()
+    for keyword in keywords
+}
+# Keywords that also occur inside a longer keyword ("|" in "||"): those
+# occurrences belong to the longer one and are subtracted from the shorter.
+_NESTED_KEYWORDS = [
+    (short, long, long.count(short))
+    for short in _KEYWORD_CATEGORY
+    for long in _KEYWORD_CATEGORY
+    if short != long and short in long
+]
+_BASE_TOKENS = ("'", '"', "--", "(", " ")
+# Everything the extended set counts, each token once: the bad words and the
+# category keywords overlap ("select", "union", "--" ...).
+_EXTENDED_TOKENS = tuple(sorted(set(_BASE_TOKENS) | set(BAD_WORDS) | set(_KEYWORD_CATEGORY)))
+
+_DIGIT, _UPPER, _LOWER, _SPACE, _SPECIAL, _NONPRINT = range(6)
+
+
+def _class_of(byte: int) -> int:
+    char = chr(byte)
+    if "0" <= char <= "9":
+        return _DIGIT
+    if "A" <= char <= "Z":
+        return _UPPER
+    if "a" <= char <= "z":
+        return _LOWER
+    if char in " \t\n\r":
+        return _SPACE
+    if 33 <= byte < 127:
+        return _SPECIAL
+    return _NONPRINT
+
+
+_CLASS_OF = [_class_of(byte) for byte in range(256)]
+# Below this size a Counter histogram is cheaper than numpy's per-call overhead.
+SMALL_SCAN_BYTES = 2048
+
+
+@lru_cache(maxsize=None)
+def _byte_classes():
+    """Byte -> character class matrix used to fold the histogram into class counts.
+
+    numpy is only imported once a payload larger than ``SMALL_SCAN_BYTES`` is
+    scanned; the base feature set and typical requests are pure Python.
+    """
+    import numpy as np
+
+    byte_class = np.zeros((6, 256), dtype=np.int64)
+    byte_class[_CLASS_OF, np.arange(256)] = 1
+    return byte_class
+
+
+def count_badwords(text: str) -> int:
+    return sum(text.count(word) for word in BAD_WORDS)
+
+
+def _base_counts(text: str, counts: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    if counts is None:
+        return {
+            "single_q": text.count("'"),
+            "double_q": text.count('"'),
+            "dashes": text.count("--"),
+            "braces": text.count("("),
+            "spaces": text.count(" "),
+            "badwords": count_badwords(text),
+        }
+    return {
+        "single_q": counts["'"],
+        "double_q": counts['"'],
+        "dashes": counts["--"],
+        "braces": counts["("],
+        "spaces": counts[" "],
+        "badwords": sum(map(counts.__getitem__, BAD_WORDS)),
+    }
+
+
+def _header_features(headers: Optional[Dict[str, str]]) -> Dict[str, int]:
+    headers = headers or {}
+    names = {str(k).lower() for k in headers}
+    hdr_badwords = 0
+    hdr_max_len = 0
+    for value in headers.values():
+        value = str(value or "")
+        hdr_max_len = max(hdr_max_len, len(value))
+        hdr_badwords += count_badwords(normalize(value)[0])
+    return {
+        "hdr_count": len(headers),
+        "hdr_missing_ua": int(bool(headers) and "user-agent" not in names),
+        "hdr_badwords": hdr_badwords,
+        "hdr_max_len": hdr_max_len,
+    }
+
+
+def _category_hits(counts: Dict[str, int]) -> Dict[str, int]:
+    hits = {
+        category: sum(map(counts.__getitem__, keywords))
+        for category, keywords in CATEGORY_KEYWORDS.items()
+    }
+    for short, long, times in _NESTED_KEYWORDS:
+        hits[_KEYWORD_CATEGORY[short]] -= counts[long] * times
+    return hits
+
+
+def category_counts(text: str) -> Dict[str, int]:
+    """Keyword hits per attack category in normalised text."""
+    return _category_hits(dict(zip(_KEYWORD_CATEGORY, map(text.count, _KEYWORD_CATEGORY))))
+
+
+def _histogram(data: bytes) -> Tuple[List[int], List[int]]:
+    """Non-zero byte counts and the count per character class."""
+    classes = [0] * 6
+    if len(data) <= SMALL_SCAN_BYTES:
+        counts = list(Counter(data).items())
+        for byte, count in counts:
+            classes[_CLASS_OF[byte]] += count
+        return [count for _, count in counts], classes
+
+    import numpy as np
+
+    hist = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    return hist[hist > 0].tolist(), (_byte_classes() @ hist).tolist()
+
+
+def _scan(data: bytes) -> Dict[str, float]:
+    """Length, character-class ratios and entropy from one byte histogram."""
+    total = len(data)
+    counts, classes = _histogram(data)
+    entropy = 0.0 - sum(c / total * log2(c / total) for c in counts) if total else 0.0
+
+    denom = total or 1
+    return {
+        "length": total,
+        "digit_ratio": classes[_DIGIT] / denom,
+        "alpha_ratio": (classes[_UPPER] + classes[_LOWER]) / denom,
+        "space_ratio": classes[_SPACE] / denom,
+        "special_ratio": classes[_SPECIAL] / denom,
+        "nonprint_ratio": classes[_NONPRINT] / denom,
+        "entropy": entropy,
+    }
+
+
+def normalize_request(path: Payload, body: Payload = "") -> Tuple[str, int]:
+    """Normalised ``"<path> <body>"`` text and the deeper of the two encoding depths."""
+    text_path, path_depth = normalize(path)
+    text_body, body_depth = normalize(body)
+    return f"{text_path} {text_body}", max(path_depth, body_depth)
+
+
+def extract_features(
+    path: Payload,
+    body: Payload = "",
+    headers: Optional[Dict[str, str]] = None,
+    feature_set: str = "extended",
+    keep_text: bool = False,
+) -> Dict[str, Any]:
+    """
+    Compute the features of one request.
+
+    The result always holds the base counts; the extended features are only
+    computed when ``feature_set == "extended"``. With ``keep_text`` the
+    normalised text is returned under ``"combined"``. Header values count
+    towards ``badwords`` as they did when the shipped models were trained.
+    """
+    if feature_set not in FEATURE_SETS:
+        raise ValueError(f"Unknown feature set: {feature_set}")
+
+    combined, depth = normalize_request(path, body)
+    header_features = _header_features(headers)
+
+    if feature_set == "extended":
+        counts = dict(zip(_EXTENDED_TOKENS, map(combined.count, _EXTENDED_TOKENS)))
+        features: Dict[str, Any] = _base_counts(combined, counts)
+        features.update(_category_hits(counts))
+        data = combined[:MAX_INSPECT_BYTES].encode("utf-8", errors="ignore")[:MAX_INSPECT_BYTES]
+        features.update(_scan(data))
+        features["encoding_depth"] = depth
+        features.update(header_features)
+    else:
+        features = _base_counts(combined)
+    features["badwords"] += header_features["hdr_badwords"]
+
+    if keep_text:
+        features["combined"] = combined
+    return features
+
+
+def to_vector(features: Dict[str, Any], names: Sequence[str] = BASE_FEATURES) -> List[float]:
+    return [features[name] for name in names]
+
+
+def to_matrix(rows: Iterable[Dict[str, Any]], names: Sequence[str] = BASE_FEATURES) -> List[List[float]]:
+    return [to_vector(row, names) for row in rows]
+
+
+def feature_set_for(model: Any) -> str:
+    """Pick the feature set a fitted model expects from its input width."""
+    width = getattr(model, "n_features_in_", len(BASE_FEATURES))
+    for name, names in FEATURE_SETS.items():
+        if len(names) == width:
+            return name
+    raise ValueError(f"No feature set with {width} features")
@@ -0,0 +1,300 @@
+"""
+Admission control and degraded mode for the proxy under overload.
+
+``ThreadingTCPServer`` starts a thread per connection, so without a limit a
+burst turns into hundreds of threads all scoring, writing SQLite and waiting
+on the upstream at once. ``LoadController`` allows at most
+``WAF_MAX_CONCURRENCY`` requests past admission. Requests beyond that wait
+in a bounded admission queue (``WAF_ADMISSION_QUEUE`` waiters) for at most
+``WAF_MAX_QUEUE_MS``. A request that finds the queue full, or waits longer
+than that, is shed:
+
+* fail closed - answered with 503 and ``Retry-After`` (the default)
+* fail open   - forwarded upstream without inspection
+
+``WAF_FAIL_MODE`` sets the default; a policy rule can override it with
+``"fail_mode"`` (e.g. open on static routes). Failing open by default would
+let anyone who fills the queue through uninspected. Fail-open forwards have
+their own limit, ``WAF_FAIL_OPEN_CONCURRENCY``, so overload does not turn
+into unbounded parallel traffic to the upstream: a fail-open request that
+finds it full fails closed.
+
+The controller also tracks the p95 of queue wait plus inspection time over
+the last ``LATENCY_WINDOW`` requests. When it breaches ``WAF_LATENCY_SLO_MS``,
+or a request is shed, the proxy enters degraded mode. In degraded mode it
+skips the stages listed in ``WAF_DEGRADE`` (comma separated):
+
+* ``db``        - no SQLite insert / status update
+* ``broadcast`` - no dashboard WebSocket event
+* ``body``      - bodies over ``DEGRADED_BODY_BYTES`` are shed instead of inspected
+* ``rules``     - keyword rules instead of the model (see ``rule_verdict``)
+
+The default is ``db,broadcast,body``. Normal mode resumes once the p95 is back
+under ``RECOVER_RATIO`` of the SLO, and nothing has been shed for
+``MIN_DEGRADED_SECONDS``.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from feature_extractor import category_counts, normalize_request
+
+FAIL_MODES = ("open", "closed")
+DEGRADE_STAGES = ("db", "broadcast", "body", "rules")
+
+MAX_CONCURRENCY = int(os.environ.get("WAF_MAX_CONCURRENCY", 64))
+ADMISSION_QUEUE = int(os.environ.get("WAF_ADMISSION_QUEUE", 256))
+MAX_QUEUE_MS = float(os.environ.get("WAF_MAX_QUEUE_MS", 100))
+LATENCY_SLO_MS = float(os.environ.get("WAF_LATENCY_SLO_MS", 50))
+FAIL_MODE = os.environ.get("WAF_FAIL_MODE", "closed").lower()
+FAIL_OPEN_CONCURRENCY = int(os.environ.get("WAF_FAIL_OPEN_CONCURRENCY", 8))
+DEGRADE = os.environ.get("WAF_DEGRADE", "db,broadcast,body")
+
+LATENCY_WINDOW = 512
+EVALUATE_EVERY = 32
+RECOVER_RATIO = 0.7
+MIN_DEGRADED_SECONDS = 5.0
+DEGRADED_BODY_BYTES = 1024
+RULE_MIN_HITS = 2
+
+
+class LoadConfigError(ValueError):
+    """Invalid fail mode or degrade stage."""
+
+
+def parse_degrade(value: str) -> Tuple[str, ...]:
+    stages = tuple(stage.strip().lower() for stage in value.split(",") if stage.strip())
+    unknown = [stage for stage in stages if stage not in DEGRADE_STAGES]
+    if unknown:
+        raise LoadConfigError(f"unknown degrade stage(s) {', '.join(unknown)} "
+                              f"(expected {', '.join(DEGRADE_STAGES)})")
+    return stages
+
+
+def rule_verdict(path: Any, body: Any) -> Tuple[int, float]:
+    """
+    Cheap fallback for the model: (is_malicious, score) from one keyword scan
+    of the normalised request. It takes ``RULE_MIN_HITS`` attack keywords to
+    block, so a single ``update`` or ``--`` in benign traffic does not.
+    """
+    text, _ = normalize_request(path, body)
+    hits = sum(category_counts(text).values())
+    return int(hits >= RULE_MIN_HITS), hits / (hits + RULE_MIN_HITS)
+
+
+def _percentile(sorted_values, pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(pct / 100 * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class Ticket:
+    """The outcome of admission for one request."""
+
+    __slots__ = ("controller", "admitted", "degraded", "reason", "queued_ms", "_start", "_recorded")
+
+    def __init__(self, controller: "LoadController", admitted: bool, degraded: bool,
+                 reason: Optional[str], queued_ms: float, start: float):
+        self.controller = controller
+        self.admitted = admitted
+        self.degraded = degraded
+        self.reason = reason
+        self.queued_ms = queued_ms
+        self._start = start
+        self._recorded = False
+
+    def skips(self, stage: str) -> bool:
+        """Whether this request should skip a degradable stage."""
+        return self.degraded and stage in self.controller.degrade
+
+    def inspected(self) -> None:
+        """Record queue wait + inspection time; call once the verdict is known, before forwarding."""
+        if not self._recorded:
+            self._recorded = True
+            self.controller.record((time.perf_counter() - self._start) * 1000)
+
+    def release(self) -> None:
+        if self.admitted:
+            self.admitted = False
+            self.controller.release()
+
+
+class LoadController:
+    """Concurrency limit, bounded admission queue, shedding and the degraded-mode switch."""
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        queue_size: int = ADMISSION_QUEUE,
+        max_queue_ms: float = MAX_QUEUE_MS,
+        slo_ms: float = LATENCY_SLO_MS,
+        fail_mode: str = FAIL_MODE,
+        degrade: Any = DEGRADE,
+        fail_open_concurrency: int = FAIL_OPEN_CONCURRENCY,
+    ):
+        if fail_mode not in FAIL_MODES:
+            raise LoadConfigError(f"fail mode must be one of {', '.join(FAIL_MODES)}, not {fail_mode!r}")
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.max_queue_ms = max_queue_ms
+        self.slo_ms = slo_ms
+        self.fail_mode = fail_mode
+        self.fail_open_concurrency = fail_open_concurrency
+        self.degrade = parse_degrade(degrade) if isinstance(degrade, str) else tuple(degrade)
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._open_slots = threading.BoundedSemaphore(fail_open_concurrency) if fail_open_concurrency else None
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._queue_waits: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._since_evaluation = 0
+        self._last_shed = 0.0
+        self.p95_ms: Optional[float] = None
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed: Dict[str, int] = {"open": 0, "closed": 0}
+        self.forwarding_open = 0
+        self.fail_open_overflow = 0
+        self.degraded = False
+        self.degraded_since: Optional[float] = None
+        self.degraded_reason: Optional[str] = None
+        self.degraded_requests = 0
+        self.degraded_episodes = 0
+
+    # ---------- admission ----------
+
+    def admit(self) -> Ticket:
+        """Take a slot, waiting in the admission queue if needed. Never blocks longer than max_queue_ms."""
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.queue_size:
+                    return self._reject(start, "queue_full")
+                self.waiting += 1
+            acquired = self._slots.acquire(timeout=self.max_queue_ms / 1000)
+            with self._lock:
+                self.waiting -= 1
+                if not acquired:
+                    return self._reject(start, "queue_timeout")
+
+        queued_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+            self._queue_waits.append(queued_ms)
+            degraded = self.degraded
+            if degraded:
+                self.degraded_requests += 1
+        return Ticket(self, True, degraded, None, queued_ms, start)
+
+    def _reject(self, start: float, reason: str) -> Ticket:
+        # called with the lock held
+        self._last_shed = time.monotonic()
+        self._enter_degraded(reason)
+        return Ticket(self, False, True, reason, (time.perf_counter() - start) * 1000, start)
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def shed_request(self, fail_mode: Optional[str] = None) -> str:
+        """
+        Count one shed request; returns the fail mode that applies to it. "open"
+        holds a fail-open slot, give it back with ``release_open`` after forwarding.
+        """
+        mode = fail_mode or self.fail_mode
+        overflow = False
+        if mode == "open" and (self._open_slots is None or not self._open_slots.acquire(blocking=False)):
+            mode, overflow = "closed", True
+        with self._lock:
+            self.shed[mode] += 1
+            if overflow:
+                self.fail_open_overflow += 1
+            elif mode == "open":
+                self.forwarding_open += 1
+        return mode
+
+    def release_open(self) -> None:
+        with self._lock:
+            self.forwarding_open -= 1
+        self._open_slots.release()
+
+    # ---------- degraded mode ----------
+
+    def record(self, latency_ms: float) -> None:
+        with self._lock:
+            self._latencies.append(latency_ms)
+            self._since_evaluation += 1
+            if self._since_evaluation < EVALUATE_EVERY:
+                return
+            self._since_evaluation = 0
+            self.p95_ms = _percentile(sorted(self._latencies), 95)
+            if self.p95_ms > self.slo_ms:
+                self._enter_degraded("latency_slo")
+            elif self.degraded and self.p95_ms < self.slo_ms * RECOVER_RATIO:
+                now = time.monotonic()
+                if (now - self.degraded_since >= MIN_DEGRADED_SECONDS
+                        and now - self._last_shed >= MIN_DEGRADED_SECONDS):
+                    self.degraded = False
+                    self.degraded_since = None
+                    self.degraded_reason = None
+                    print(f"Load back to normal (p95 {self.p95_ms:.1f} ms)")
+
+    def _enter_degraded(self, reason: str) -> None:
+        # called with the lock held
+        if self.degraded:
+            return
+        self.degraded = True
+        self.degraded_since = time.monotonic()
+        self.degraded_reason = reason
+        self.degraded_episodes += 1
+        print(f"Entering degraded mode ({reason}); skipping {', '.join(self.degrade) or 'nothing'}")
+
+    # ---------- API ----------
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._queue_waits)
+            return {
+                "state": "degraded" if self.degraded else "normal",
+                "degraded_reason": self.degraded_reason,
+                "degraded_for_s": (time.monotonic() - self.degraded_since) if self.degraded else None,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+                "forwarding_open": self.forwarding_open,
+                "fail_open_overflow": self.fail_open_overflow,
+                "degraded_requests": self.degraded_requests,
+                "degraded_episodes": self.degraded_episodes,
+                "latency_p95_ms": self.p95_ms,
+                "queue_wait_p95_ms": _percentile(waits, 95),
+                "config": {
+                    "max_concurrency": self.max_concurrency,
+                    "queue_size": self.queue_size,
+                    "max_queue_ms": self.max_queue_ms,
+                    "slo_ms": self.slo_ms,
+                    "fail_mode": self.fail_mode,
+                    "fail_open_concurrency": self.fail_open_concurrency,
+                    "degrade": list(self.degrade),
+                },
+            }
+
+
+_controller: Optional[LoadController] = None
+_controller_lock = threading.Lock()
+
+
+def get_load_controller() -> LoadController:
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = LoadController()
+    return _controller
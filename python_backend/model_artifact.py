@@ -0,0 +1,225 @@
+"""
+Memory-mapped, versioned model artifact (``.wafrf``) replacing the joblib pickle at serving time.
+
+Layout (little endian)::
+
+    0       8 bytes   magic  b"WAFRF\\x00\\x00\\x01"
+    8       4 bytes   uint32 length of the JSON header
+    12      N bytes   JSON header: format version, feature set and names,
+                      threshold, target class, base value, max depth,
+                      sha256 of the data section, sha256 of the source
+                      pickle, and dtype/shape/offset of every array
+    ...               zero padding to a 64 byte boundary
+    data              the arrays of explainer.ARRAY_FIELDS, each 64 byte aligned
+
+Serving processes ``mmap`` the file read-only and evaluate the forest directly
+from the mapped arrays (``explainer.TreePathExplainer.from_arrays``), so every
+proxy worker shares one physical copy through the page cache, loading takes
+milliseconds, and nothing is unpickled.
+
+    python model_artifact.py convert model.pkl model.wafrf [--threshold 0.25]
+    python model_artifact.py verify model.pkl model.wafrf
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from explainer import ARRAY_FIELDS, TreePathExplainer, flatten_forest
+from feature_extractor import FEATURE_SETS, feature_set_for
+
+MAGIC = b"WAFRF\x00\x00\x01"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+ARTIFACT_SUFFIX = ".wafrf"
+
+
+class ArtifactError(ValueError):
+    """The file is not a valid model artifact (bad magic, version or checksum)."""
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def file_sha256(path: Path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def is_artifact(path: Path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def export_model(
+    model: Any,
+    path: Path,
+    threshold: float,
+    feature_set: Optional[str] = None,
+    target_class: Any = 0,
+    source_sha256: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Write ``model`` (a fitted tree / forest) as an artifact. Returns the header."""
+    import numpy as np
+
+    feature_set = feature_set or feature_set_for(model)
+    feature_names = list(FEATURE_SETS[feature_set])
+    flat = flatten_forest(model, len(feature_names), target_class)
+
+    arrays, layout, offset = [], [], 0
+    for name in ARRAY_FIELDS:
+        array = np.ascontiguousarray(flat[name]).astype(flat[name].dtype.newbyteorder("<"), copy=False)
+        offset = _align(offset)
+        layout.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape),
+                       "offset": offset, "nbytes": array.nbytes})
+        arrays.append((offset, array))
+        offset += array.nbytes
+
+    data = bytearray(offset)
+    for start, array in arrays:
+        data[start:start + array.nbytes] = array.tobytes()
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "feature_set": feature_set,
+        "feature_names": feature_names,
+        "threshold": float(threshold),
+        "target_class": target_class.item() if hasattr(target_class, "item") else target_class,
+        "base_value": flat["base_value"],
+        "max_depth": flat["max_depth"],
+        "n_trees": len(flat["roots"]),
+        "n_nodes": len(flat["feature"]),
+        "data_sha256": hashlib.sha256(data).hexdigest(),
+        "source_sha256": source_sha256,
+        "arrays": layout,
+    }
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+    data_start = _align(len(MAGIC) + 4 + len(header_bytes))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\x00" * (data_start - f.tell()))
+        f.write(data)
+    return header
+
+
+def read_header(buffer: Any) -> Tuple[Dict[str, Any], int]:
+    """Parse and validate the header of a mapped artifact. Returns (header, data offset)."""
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ArtifactError("not a WAF model artifact")
+    (length,) = struct.unpack_from("<I", buffer, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(bytes(buffer[start:start + length]).decode("utf-8"))
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ArtifactError(f"unsupported artifact version {header.get('format_version')}")
+    return header, _align(start + length)
+
+
+class ModelArtifact:
+    """A read-only mapping of an artifact file and the explainer evaluated from it."""
+
+    def __init__(self, path: Path, verify: bool = True):
+        import numpy as np
+
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header, data_start = read_header(self._mmap)
+        data = memoryview(self._mmap)[data_start:]
+
+        if verify and hashlib.sha256(data).hexdigest() != header["data_sha256"]:
+            raise ArtifactError(f"checksum mismatch in {self.path}")
+
+        arrays: Dict[str, Any] = {
+            "base_value": header["base_value"],
+            "max_depth": header["max_depth"],
+        }
+        for entry in header["arrays"]:
+            array = np.frombuffer(data, dtype=np.dtype(entry["dtype"]),
+                                  count=int(np.prod(entry["shape"])), offset=entry["offset"])
+            arrays[entry["name"]] = array.reshape(entry["shape"])
+
+        self.header = header
+        self.feature_set = header["feature_set"]
+        self.feature_names = header["feature_names"]
+        self.threshold = header["threshold"]
+        self.explainer = TreePathExplainer.from_arrays(self.feature_names, arrays)
+
+
+def load_artifact(path: Path, verify: bool = True) -> ModelArtifact:
+    return ModelArtifact(path, verify=verify)
+
+
+# ---------- CLI ----------
+
+def convert(pickle_path: Path, artifact_path: Path, threshold: float) -> Dict[str, Any]:
+    import joblib
+
+    model = joblib.load(pickle_path)
+    return export_model(model, artifact_path, threshold, source_sha256=file_sha256(pickle_path))
+
+
+def verify_equivalence(pickle_path: Path, artifact_path: Path, samples: int = 5000, seed: int = 0) -> float:
+    """
+    Largest |predict_proba - artifact probability| over the training CSV
+    feature rows plus random vectors. Raises if it exceeds 1e-9.
+    """
+    import csv
+    import joblib
+    import numpy as np
+
+    model = joblib.load(pickle_path)
+    artifact = load_artifact(artifact_path)
+    names = artifact.feature_names
+    width = len(names)
+
+    rows = []
+    training_csv = Path(__file__).resolve().parent.parent / "model_training" / "train_data.csv"
+    if training_csv.exists() and artifact.feature_set == "base":
+        with open(training_csv, newline="", encoding="utf-8") as f:
+            rows = [[float(r[n]) for n in names] for r in csv.DictReader(f, escapechar="\\")]
+    rng = np.random.RandomState(seed)
+    X = np.vstack([np.array(rows).reshape(-1, width), rng.randint(0, 40, size=(samples, width))])
+
+    class_index = list(model.classes_).index(artifact.header["target_class"])
+    expected = model.predict_proba(X)[:, class_index]
+    got = np.array([artifact.explainer.explain(x)["probability"] for x in X])
+    worst = float(np.abs(expected - got).max())
+    if worst > 1e-9:
+        raise ArtifactError(f"artifact differs from {pickle_path}: max |dp| = {worst}")
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert / verify memory-mapped WAF model artifacts.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    conv = sub.add_parser("convert", help="write an artifact from a joblib pickle")
+    conv.add_argument("pickle")
+    conv.add_argument("artifact")
+    conv.add_argument("--threshold", type=float, default=0.25)
+    ver = sub.add_parser("verify", help="check an artifact scores exactly like its pickle")
+    ver.add_argument("pickle")
+    ver.add_argument("artifact")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        header = convert(Path(args.pickle), Path(args.artifact), args.threshold)
+        print(f"[+] Wrote {args.artifact}: {header['n_trees']} trees, {header['n_nodes']} nodes, "
+              f"feature set {header['feature_set']}, threshold {header['threshold']}")
+    else:
+        worst = verify_equivalence(Path(args.pickle), Path(args.artifact))
+        print(f"[+] {args.artifact} matches {args.pickle} (max |dp| = {worst:.3g})")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
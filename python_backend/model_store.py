@@ -0,0 +1,150 @@
+"""
+The one WAF model shared by the API and the proxy.
+
+Nothing is loaded at import time: the model is only loaded on the first
+scoring call, or earlier through ``prewarm()``, which the API runs at startup
+when ``WAF_PREWARM=1``. Paths are resolved next to this file, not against the
+working directory, and ``WAF_MODEL_PATH`` overrides them.
+
+Serving uses the memory-mapped artifact ``model.wafrf`` (see
+model_artifact.py): it loads in milliseconds, needs neither joblib nor
+scikit-learn, is shared between processes and is checksummed. A pickle is
+never loaded implicitly. Unpickling executes whatever the file contains, so
+replacing ``model.pkl`` must not be enough to change what the WAF runs. Set
+``WAF_ALLOW_PICKLE=1`` to serve ``model.pkl`` (or a pickle named by
+``WAF_MODEL_PATH``) anyway; without it a missing artifact is a startup error.
+A ``model.pkl`` newer than the artifact (retrained but not converted) is
+reported; the artifact is still served.
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from feature_extractor import FEATURE_SETS, feature_set_for, to_vector
+
+PICKLE_PATH = Path(__file__).with_name("model.pkl")
+ARTIFACT_PATH = Path(__file__).with_name("model.wafrf")
+MODEL_PATH = os.environ.get("WAF_MODEL_PATH")
+ALLOW_PICKLE = os.environ.get("WAF_ALLOW_PICKLE", "").lower() in ("1", "true", "yes")
+
+
+class ModelLoadError(RuntimeError):
+    """No servable model: the artifact is missing and pickles are not allowed."""
+
+
+class LoadedModel:
+    """A scoring model together with its feature set, explainer and (artifact only) threshold."""
+
+    def __init__(self, path: Path, model: Any = None, artifact: Any = None):
+        self.path = path
+        self.model = model
+        self.threshold: Optional[float] = None
+        if artifact is not None:
+            self.feature_set = artifact.feature_set
+            self.feature_names = FEATURE_SETS[self.feature_set]
+            self.explainer = artifact.explainer
+            self.threshold = artifact.threshold
+        else:
+            from explainer import build_explainer
+
+            self.feature_set = feature_set_for(model)
+            self.feature_names = FEATURE_SETS[self.feature_set]
+            self.explainer = build_explainer(model, self.feature_names)
+
+    def score(self, features: Dict[str, Any]) -> Tuple[float, Optional[Dict[str, Any]]]:
+        """
+        Malicious probability (class 0) of one request, and its explanation
+        when the model is a tree ensemble (``None`` otherwise).
+        """
+        vector = to_vector(features, self.feature_names)
+        if self.explainer is not None:
+            verdict = self.explainer.explain(vector)
+            return verdict["probability"], verdict
+
+        import numpy as np
+
+        feature_vector = np.array([vector])
+        if hasattr(self.model, "predict_proba"):
+            return float(self.model.predict_proba(feature_vector)[0][0]), None
+        prediction = self.model.predict(feature_vector)[0]
+        return (0.7 if prediction == 0 else 0.1), None
+
+
+def _refuse_pickle(path: Path, allow_pickle: bool) -> None:
+    if not allow_pickle:
+        raise ModelLoadError(
+            f"refusing to unpickle {path}: convert it with "
+            f"'python model_artifact.py convert {path.name} {ARTIFACT_PATH.name}' "
+            f"or set WAF_ALLOW_PICKLE=1"
+        )
+
+
+def _load_pickle(path: Path, allow_pickle: bool) -> LoadedModel:
+    _refuse_pickle(path, allow_pickle)
+    import joblib
+
+    print(f"Loading pickled model {path} (WAF_ALLOW_PICKLE is set)")
+    return LoadedModel(path, model=joblib.load(path))
+
+
+def _load_artifact(path: Path) -> LoadedModel:
+    from model_artifact import load_artifact
+
+    return LoadedModel(path, artifact=load_artifact(path))
+
+
+def load(path: Optional[Path] = None, allow_pickle: bool = ALLOW_PICKLE) -> LoadedModel:
+    """Load an explicit path, or the default as described above."""
+    from model_artifact import is_artifact
+
+    if path is not None:
+        path = Path(path)
+        return _load_artifact(path) if is_artifact(path) else _load_pickle(path, allow_pickle)
+
+    if ARTIFACT_PATH.exists():
+        try:
+            if PICKLE_PATH.stat().st_mtime > ARTIFACT_PATH.stat().st_mtime:
+                print(f"{PICKLE_PATH.name} is newer than {ARTIFACT_PATH.name}; serving the artifact "
+                      f"(re-run model_artifact.py convert to serve the retrained model)")
+        except OSError:
+            pass
+        return _load_artifact(ARTIFACT_PATH)
+    return _load_pickle(PICKLE_PATH, allow_pickle)
+
+
+def check_servable(path: Optional[str] = MODEL_PATH, allow_pickle: bool = ALLOW_PICKLE) -> None:
+    """Raise ModelLoadError at startup, without loading anything, if ``load`` would refuse."""
+    from model_artifact import is_artifact
+
+    if path:
+        if not is_artifact(Path(path)):
+            _refuse_pickle(Path(path), allow_pickle)
+    elif not ARTIFACT_PATH.exists():
+        _refuse_pickle(PICKLE_PATH, allow_pickle)
+
+
+_lock = threading.Lock()
+_loaded: Optional[LoadedModel] = None
+
+
+def get_model() -> LoadedModel:
+    """The shared model, loaded on first call (thread safe)."""
+    global _loaded
+    if _loaded is None:
+        with _lock:
+            if _loaded is None:
+                _loaded = load(MODEL_PATH)
+    return _loaded
+
+
+def is_loaded() -> bool:
+    return _loaded is not None
+
+
+def prewarm() -> LoadedModel:
+    """Load the model and run one scoring call so the first real request pays nothing extra."""
+    loaded = get_model()
+    loaded.score({name: 0 for name in loaded.feature_names})
+    return loaded
@@ -0,0 +1,100 @@
+"""
+Request normalisation shared by training (model_training/), the proxy and the API.
+
+Every payload goes through the same bounded decode loop before features are
+counted, so double (or mixed) encoding cannot hide a keyword from one code
+path and not the other. Each round applies, only when the text can contain
+them:
+
+* URL decoding (``%XX`` and ``+`` as space),
+* HTML entity decoding (``&#39;``, ``&lt;`` ...),
+* unicode escapes (``\\u0027``, ``\\x27``, ``%u0027``),
+
+and the loop stops at a fixed point or after ``MAX_DECODE_ROUNDS``. The
+result is case folded.
+
+Raw bodies can be passed as ``bytes``/``bytearray``/``memoryview`` straight
+from the socket. ASCII payloads are decoded with the ascii codec, and payloads
+without any escape character skip the decode loop entirely, which is the
+common case. The whole payload is always normalised: bounding the size of
+what is inspected is the caller's job (the proxy refuses bodies above
+``proxy_server.MAX_BODY_BYTES``), so a keyword can never hide behind a
+padding prefix.
+"""
+
+import html
+import re
+import urllib.parse
+from typing import Optional, Tuple, Union
+
+Payload = Union[str, bytes, bytearray, memoryview, None]
+
+MAX_DECODE_ROUNDS = 4
+
+_ESCAPE_RE = re.compile(r"[%+&\\]")
+# Numeric references, and named ones only when terminated by ";": a plain
+# "&name=value" form body must not pay for entity-prefix lookups.
+_ENTITY_RE = re.compile(r"&(?:#[0-9]{1,7};?|#[xX][0-9a-fA-F]{1,6};?|[A-Za-z][A-Za-z0-9]{1,31};)")
+_UNICODE_ESCAPE_RE = re.compile(r"\\u([0-9a-fA-F]{4})|%u([0-9a-fA-F]{4})|\\x([0-9a-fA-F]{2})")
+
+
+def _unicode_unescape(match: "re.Match[str]") -> str:
+    return chr(int(match.group(1) or match.group(2) or match.group(3), 16))
+
+
+def _entity_unescape(match: "re.Match[str]") -> str:
+    return html.unescape(match.group(0))
+
+
+def _decode_round(text: str) -> str:
+    if "%" in text or "+" in text:
+        text = urllib.parse.unquote_plus(text)
+    if "&" in text:
+        text = _ENTITY_RE.sub(_entity_unescape, text)
+    if "\\" in text or "%u" in text:
+        text = _UNICODE_ESCAPE_RE.sub(_unicode_unescape, text)
+    return text
+
+
+def decode(text: str) -> Tuple[str, int]:
+    """Decode until stable (bounded). Returns the text and the number of rounds that changed it."""
+    depth = 0
+    for _ in range(MAX_DECODE_ROUNDS):
+        decoded = _decode_round(text)
+        if decoded == text:
+            break
+        text = decoded
+        depth += 1
+    return text, depth
+
+
+def _fold(text: str) -> str:
+    return text.lower() if text.isascii() else text.casefold()
+
+
+def normalize(value: Payload) -> Tuple[str, int]:
+    """Decode and case fold one whole payload. Returns ``(text, encoding_depth)``."""
+    if not value:
+        return "", 0
+
+    if isinstance(value, str):
+        text = value
+    else:
+        try:
+            text = str(value, "ascii")
+        except UnicodeDecodeError:
+            text = str(value, "utf-8", errors="replace")
+
+    if not _ESCAPE_RE.search(text):
+        return _fold(text), 0
+    text, depth = decode(text)
+    return _fold(text), depth
+
+
+def to_text(value: Payload, encoding: Optional[str] = "utf-8") -> str:
+    """Raw (undecoded) text of a payload, for storage and display."""
+    if not value:
+        return ""
+    if isinstance(value, str):
+        return value
+    return str(value, encoding or "utf-8", errors="replace")
@@ -0,0 +1,316 @@
+"""
+Per-host / per-route inspection policy for the proxy.
+
+The policy is a JSON file (``policy.json`` next to this module, or
+``WAF_POLICY_PATH``), see ``policy.example.json``::
+
+    {
+      "default": {"action": "inspect", "threshold": 0.25},
+      "rules": [
+        {"name": "static", "extensions": [".css", ".js", ".png"], "action": "skip"},
+        {"name": "login", "path_prefix": "/login", "threshold": 0.1},
+        {"name": "partner-api", "host": "api.partner.example", "path_prefix": "/v1", "action": "monitor"}
+      ]
+    }
+
+Actions:
+
+* ``inspect`` - score the request and block it above the threshold (default)
+* ``monitor`` - score and log it, never block
+* ``skip``    - forward without scoring or logging (allowlists, static assets).
+  Only ``GET``/``HEAD`` requests without a body are skipped; any other
+  request matching a skip rule is inspected (``SKIP_METHODS``).
+
+A rule may also set ``"fail_mode": "open" | "closed"``: what happens to its
+requests when the proxy is overloaded and sheds them (see load_control.py).
+
+At load the rules are compiled into a hash map of hosts (``"*"`` for rules
+without a host), each holding a set of file extensions and a trie of path
+segments. Evaluation is one dict lookup per host table, one set lookup and
+one dict lookup per path segment; the most specific rule wins: an exact host
+over ``"*"``, a longer prefix over a shorter one, and a prefix below ``/``
+over an extension (``/login/x.js`` gets the ``/login`` rule, ``/img/x.js``
+the extension rule). Prefixes match whole segments (``/api/v1`` matches ``/api/v1/users`` but
+not ``/api/v10``).
+
+Paths are matched after normalisation, the way the upstream will resolve
+them: percent-decoded once, ``;`` path parameters dropped from each segment
+and ``.``/``..`` resolved (``/static/../admin`` is ``/admin``,
+``/admin.php;x.css`` is ``/admin.php``). A path that does not normalise
+cleanly - invalid UTF-8, ``%`` left after decoding, backslashes or control
+characters, ``..`` above the root - is never matched against the rules; it
+gets the ``unclean-path`` decision, which always inspects.
+
+``PolicyStore`` re-reads the file when its mtime changes (checked at most once
+per ``RELOAD_INTERVAL`` seconds); an invalid file is reported and the previous
+policy stays active. Rule hit counters survive reloads.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+ACTIONS = ("inspect", "monitor", "skip")
+SKIP_METHODS = ("GET", "HEAD")
+FAIL_MODES = ("open", "closed")
+DEFAULT_RULE = "default"
+UNCLEAN_RULE = "unclean-path"
+RELOAD_INTERVAL = 1.0
+POLICY_PATH = Path(os.environ.get("WAF_POLICY_PATH") or Path(__file__).with_name("policy.json"))
+
+
+class PolicyError(ValueError):
+    """The policy file is malformed."""
+
+
+class Decision:
+    """What the proxy should do with one request."""
+
+    __slots__ = ("rule", "action", "threshold", "fail_mode")
+
+    def __init__(self, rule: str, action: str, threshold: Optional[float], fail_mode: Optional[str] = None):
+        self.rule = rule
+        self.action = action
+        self.threshold = threshold
+        self.fail_mode = fail_mode
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"rule": self.rule, "action": self.action, "threshold": self.threshold,
+                "fail_mode": self.fail_mode}
+
+
+class _TrieNode:
+    __slots__ = ("children", "decision")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.decision: Optional[Decision] = None
+
+
+class _HostTable:
+    __slots__ = ("extensions", "trie")
+
+    def __init__(self):
+        self.extensions: Dict[str, Decision] = {}
+        self.trie = _TrieNode()
+
+    def lookup(self, segments: List[str], extension: str) -> Optional[Decision]:
+        node = self.trie
+        best = None
+        for segment in segments:
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.decision is not None:
+                best = node.decision
+        if best is not None:
+            return best
+        if extension and extension in self.extensions:
+            return self.extensions[extension]
+        return self.trie.decision
+
+
+_UNSAFE_PATH = re.compile(r"[\x00-\x1f\x7f\\]")
+
+
+def _segments(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+
+def normalize_path(path: str) -> Optional[List[str]]:
+    """Segments of ``path`` as the upstream resolves it (see above), or None if it is not clean."""
+    path = path.split("?", 1)[0].split("#", 1)[0]
+    if "%" in path:
+        try:
+            path = urllib.parse.unquote_to_bytes(path).decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+        if "%" in path:
+            return None
+    if _UNSAFE_PATH.search(path):
+        return None
+    segments: List[str] = []
+    for segment in path.split("/"):
+        if ";" in segment:
+            segment = segment.split(";", 1)[0]
+        if not segment or segment == ".":
+            continue
+        if segment == "..":
+            if not segments:
+                return None
+            segments.pop()
+        else:
+            segments.append(segment)
+    return segments
+
+
+def _decision(rule: Dict[str, Any], default: Decision, name: str) -> Decision:
+    action = rule.get("action", "inspect")
+    if action not in ACTIONS:
+        raise PolicyError(f"rule {name!r}: unknown action {action!r}")
+    threshold = rule.get("threshold", default.threshold)
+    if threshold is not None and not 0.0 <= float(threshold) <= 1.0:
+        raise PolicyError(f"rule {name!r}: threshold must be between 0 and 1")
+    fail_mode = rule.get("fail_mode", default.fail_mode)
+    if fail_mode is not None and fail_mode not in FAIL_MODES:
+        raise PolicyError(f"rule {name!r}: fail_mode must be 'open' or 'closed'")
+    return Decision(name, action, None if threshold is None else float(threshold), fail_mode)
+
+
+class Policy:
+    """A compiled policy. Immutable once built; reloading builds a new one."""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.config = config
+        default = config.get("default") or {}
+        self.default = _decision(default, Decision(DEFAULT_RULE, "inspect", None), DEFAULT_RULE)
+        self.unclean = Decision(UNCLEAN_RULE, "inspect", self.default.threshold, self.default.fail_mode)
+        self.hosts: Dict[str, _HostTable] = {}
+        self.rule_names: List[str] = []
+
+        for index, rule in enumerate(config.get("rules") or []):
+            name = str(rule.get("name") or f"rule-{index}")
+            if name in self.rule_names or name in (DEFAULT_RULE, UNCLEAN_RULE):
+                raise PolicyError(f"duplicate rule name {name!r}")
+            self.rule_names.append(name)
+            decision = _decision(rule, self.default, name)
+            table = self.hosts.setdefault(str(rule.get("host") or "*").lower(), _HostTable())
+
+            extensions = rule.get("extensions") or []
+            if extensions and "path_prefix" in rule:
+                raise PolicyError(f"rule {name!r}: use either extensions or path_prefix, not both")
+            for extension in extensions:
+                extension = extension.lower() if extension.startswith(".") else "." + extension.lower()
+                table.extensions[extension] = decision
+            if not extensions:
+                node = table.trie
+                for segment in _segments(rule.get("path_prefix") or "/"):
+                    node = node.children.setdefault(segment, _TrieNode())
+                node.decision = decision
+
+    def evaluate(self, host: str, path: str, method: str = "GET", has_body: bool = False) -> Decision:
+        """Decision for a request to ``host`` (no port) and ``path`` (query is ignored)."""
+        segments = normalize_path(path)
+        if segments is None:
+            return self.unclean
+        decision = self._match(host, segments)
+        if decision.action == "skip" and (has_body or method.upper() not in SKIP_METHODS):
+            # a skip rule allowlists fetching the resource, not sending it data
+            return Decision(decision.rule, "inspect", decision.threshold, decision.fail_mode)
+        return decision
+
+    def _match(self, host: str, segments: List[str]) -> Decision:
+        last = segments[-1] if segments else ""
+        dot = last.rfind(".")
+        extension = last[dot:].lower() if dot > 0 else ""
+
+        table = self.hosts.get(host.lower()) if host else None
+        if table is not None:
+            decision = table.lookup(segments, extension)
+            if decision is not None:
+                return decision
+        table = self.hosts.get("*")
+        if table is not None:
+            decision = table.lookup(segments, extension)
+            if decision is not None:
+                return decision
+        return self.default
+
+
+def split_target(url: str, host_header: Optional[str] = None) -> Tuple[str, str]:
+    """(host, path) of a proxied request line, falling back to the Host header for relative URLs."""
+    if url.startswith("/"):
+        return (host_header or "").rsplit(":", 1)[0].lower(), url
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return (parts.hostname or "").lower(), path
+
+
+class PolicyStore:
+    """The active policy for one file, hot reloaded, with per-rule hit counters."""
+
+    def __init__(self, path: Path = POLICY_PATH, reload_interval: float = RELOAD_INTERVAL):
+        self.path = Path(path)
+        self.reload_interval = reload_interval
+        self.hits: Counter = Counter()
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        self._policy = Policy()
+        self.reload()
+
+    def reload(self) -> bool:
+        """Re-read the file now. Returns False (keeping the old policy) if it is invalid."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        try:
+            if mtime is None:
+                policy = Policy()
+            else:
+                with open(self.path, encoding="utf-8") as f:
+                    policy = Policy(json.load(f))
+        except (OSError, ValueError) as exc:
+            self.last_error = f"{self.path}: {exc}"
+            print("Policy reload failed, keeping the previous policy:", self.last_error)
+            self._mtime = mtime
+            return False
+        self._policy = policy
+        self._mtime = mtime
+        self.last_error = None
+        return True
+
+    def current(self) -> Policy:
+        now = time.monotonic()
+        if now - self._checked >= self.reload_interval:
+            self._checked = now
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                self.reload()
+        return self._policy
+
+    def evaluate(self, host: str, path: str, method: str = "GET", has_body: bool = False) -> Decision:
+        decision = self.current().evaluate(host, path, method, has_body)
+        with self._lock:
+            self.hits[decision.rule] += 1
+        return decision
+
+    def snapshot(self) -> Dict[str, Any]:
+        policy = self._policy
+        with self._lock:
+            hits = dict(self.hits)
+        return {
+            "path": str(self.path),
+            "loaded": self._mtime is not None,
+            "error": self.last_error,
+            "default": policy.default.to_dict(),
+            "rules": policy.config.get("rules") or [],
+            "hits": {name: hits.get(name, 0) for name in [DEFAULT_RULE, UNCLEAN_RULE] + policy.rule_names},
+        }
+
+
+_store: Optional[PolicyStore] = None
+_store_lock = threading.Lock()
+
+
+def get_policy_store() -> PolicyStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PolicyStore()
+    return _store
@@ -1,76 +1,67 @@
+import os
 import socketserver
 import http.server
 import urllib.request
-import urllib.parse
-import joblib
-import numpy as np
 import json
 import threading
 import sqlite3
 import uuid
 from datetime import datetime
 
-MODEL_PATH = "model.pkl"
-THRESHOLD = 0.25
+from feature_extractor import extract_features
+from explainer import describe, top_contributions
+from exporter import get_exporter
+from load_control import DEGRADED_BODY_BYTES, get_load_controller, rule_verdict
+from model_store import check_servable, get_model
+from normalizer import to_text
+from policy import get_policy_store, split_target
 
-MODEL = joblib.load(MODEL_PATH)
-
-BAD_WORDS = [
-    "sleep", "drop", "uid", "select", "waitfor", "delay",
-    "system", "union", "order by", "group by",
-    "insert", "update", "delete", "benchmark",
-    "and 1=1", "or 1=1", "--", "#"
-]
-
-# Initialize SQLite database
-conn = sqlite3.connect("waf.db")
-c = conn.cursor()
-c.execute("""
-CREATE TABLE IF NOT EXISTS logs1 (
-    id TEXT PRIMARY KEY,
-    method TEXT,
-    url TEXT,
-    body TEXT,
-    headers TEXT,
-    malicious_prob REAL,
-    malicious INTEGER,
-    status TEXT,
-    created_at TEXT
-)
-""")
-conn.commit()
-conn.close()
-
-
-def extract_features(path: str, body: str):
-    decoded_path = urllib.parse.unquote(path or "")
-    decoded_body = urllib.parse.unquote(body or "")
-    combined = f"{decoded_path} {decoded_body}"
-
-    features = {
-        "single_q": combined.count("'"),
-        "double_q": combined.count('"'),
-        "dashes": combined.count("--"),
-        "braces": combined.count("("),
-        "spaces": combined.count(" "),
-        "badwords": sum(combined.lower().count(word) for word in BAD_WORDS)
-    }
-    return features
-
-
-def waf_predict(features):
-    vec = np.array([[
-        features["single_q"],
-        features["double_q"],
-        features["dashes"],
-        features["braces"],
-        features["spaces"],
-        features["badwords"],
-    ]])
-
-    malicious_prob = MODEL.predict_proba(vec)[:, 0][0]
-    is_malicious = int(malicious_prob > THRESHOLD)  # 1 = malicious, 0 = normal
-    return is_malicious, malicious_prob
+THRESHOLD = 0.25
+DB_PATH = "waf.db"
+# Larger bodies are refused (413) rather than forwarded partly inspected.
+MAX_BODY_BYTES = int(os.environ.get("WAF_MAX_BODY_BYTES", 1024 * 1024))
+
+
+def init_db():
+    """Create (or upgrade) the logs1 table. Called on API startup and before the proxy starts."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS logs1 (
+        id TEXT PRIMARY KEY,
+        method TEXT,
+        url TEXT,
+        body TEXT,
+        headers TEXT,
+        malicious_prob REAL,
+        malicious INTEGER,
+        status TEXT,
+        created_at TEXT
+    )
+    """)
+    # explanation was added later; older databases need the column
+    if "explanation" not in {row[1] for row in c.execute("PRAGMA table_info(logs1)")}:
+        c.execute("ALTER TABLE logs1 ADD COLUMN explanation TEXT")
+    conn.commit()
+    conn.close()
+
+
+def waf_predict(features, threshold=None):
+    """
+    Returns (is_malicious, malicious_prob, explanation); explanation is None for non-tree models.
+    threshold (from the route policy) overrides the model / global threshold.
+    """
+    model = get_model()
+    malicious_prob, verdict = model.score(features)
+    if threshold is None:
+        threshold = model.threshold if model.threshold is not None else THRESHOLD
+    is_malicious = int(malicious_prob > threshold)  # 1 = malicious, 0 = normal
+    return is_malicious, malicious_prob, verdict
+
+
+def request_features(url, raw_body, headers, feature_set):
+    """Features of one proxied request: the raw body bytes and the headers as received."""
+    return extract_features(url, raw_body, dict(headers), feature_set=feature_set)
 
 
 class AIProxy(http.server.SimpleHTTPRequestHandler):
@@ -84,73 +75,189 @@ class AIProxy(http.server.SimpleHTTPRequestHandler):
     def handle_proxy(self, method):
         url = self.path
 
+        # ---------- Route policy ----------
         content_len = int(self.headers.get("Content-Length", 0))
-        body = self.rfile.read(content_len).decode("utf-8") if content_len else ""
-
-        # ---------- AI Prediction ----------
-        is_malicious, mp = waf_predict(extract_features(url, body))
-        created_at = datetime.utcnow().isoformat()
+        host, path = split_target(url, self.headers.get("Host"))
+        decision = get_policy_store().evaluate(host, path, method, has_body=content_len != 0)
 
-        req_id = str(uuid.uuid4())
+        # every route, skipped or not: the body is read into memory before forwarding
+        if not 0 <= content_len <= MAX_BODY_BYTES:
+            self.refuse_oversized(content_len, decision)
+            return
+        raw_body = self.rfile.read(content_len) if content_len else b""
 
+        # ---------- Admission ----------
+        ticket = get_load_controller().admit()
+        if not ticket.admitted:
+            self.shed(method, url, raw_body, decision, ticket)
+            return
         try:
-            import asyncio
-            from app import broadcast_new_request
+            if decision.action == "skip":
+                self.forward(method, url, raw_body)
+            elif ticket.skips("body") and len(raw_body) > DEGRADED_BODY_BYTES:
+                # degraded: large bodies are not inspected, so they are not forwarded as if they were
+                self.shed(method, url, raw_body, decision, ticket, reason="degraded_body")
+            else:
+                self.inspect(method, url, raw_body, decision, ticket)
+        finally:
+            ticket.release()
+
+    def inspect(self, method, url, raw_body, decision, ticket):
+        body = to_text(raw_body)
 
-            asyncio.run(broadcast_new_request({
-                "id": req_id,
-                "method": method,
-                "url": url,
-                "body": body,
-                "headers": dict(self.headers),
-                "malicious_prob": mp,
-                "malicious": bool(is_malicious),
-                "status": "pending",
-                "created_at": created_at
-            }))
+        # ---------- AI Prediction ----------
+        # degraded mode may replace the model with keyword rules
+        if ticket.skips("rules"):
+            features, verdict = None, None
+            is_malicious, mp = rule_verdict(url, raw_body)
+        else:
+            features = request_features(url, raw_body, self.headers, get_model().feature_set)
+            is_malicious, mp, verdict = waf_predict(features, decision.threshold)
+        created_at = datetime.utcnow().isoformat()
 
-        except Exception as e:
-            print("WebSocket broadcast error:", e)
-
-        # ---------- Save to DB ----------
-        conn = sqlite3.connect("waf.db")
-        c = conn.cursor()
-        c.execute(
-            "INSERT INTO logs1 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (
-                req_id,
-                method,
-                url,
-                body,
-                json.dumps(dict(self.headers)),
-                mp,
-                is_malicious,
-                "pending",
-                created_at
-            )
-        )
-        conn.commit()
-        conn.close()
+        explanation = None
+        if is_malicious and verdict is not None:
+            explanation = {
+                "summary": describe(verdict, features),
+                "baseValue": verdict["baseValue"],
+                "contributions": top_contributions(verdict, features, limit=len(verdict["contributions"])),
+            }
 
+        req_id = str(uuid.uuid4())
+        event = {
+            "id": req_id,
+            "method": method,
+            "url": url,
+            "body": body,
+            "headers": dict(self.headers),
+            "malicious_prob": mp,
+            "malicious": bool(is_malicious),
+            "status": "pending",
+            "created_at": created_at,
+            "explanation": explanation,
+            "policy": decision.to_dict(),
+            "degraded": ticket.degraded
+        }
+
+        if not ticket.skips("broadcast"):
+            try:
+                import asyncio
+                from app import broadcast_new_request
+
+                asyncio.run(broadcast_new_request(event))
+
+            except Exception as e:
+                print("WebSocket broadcast error:", e)
+
+        # monitor-only routes are logged as detections but still forwarded
+        status = "pending"
         if is_malicious:
-            conn = sqlite3.connect("waf.db")
+            status = "monitored" if decision.action == "monitor" else "blocked"
+
+        # ---------- Save to DB ----------
+        if not ticket.skips("db"):
+            conn = sqlite3.connect(DB_PATH)
             c = conn.cursor()
-            c.execute("UPDATE logs1 SET status = ? WHERE id = ?", ("blocked", req_id))
+            c.execute(
+                "INSERT INTO logs1 (id, method, url, body, headers, malicious_prob, malicious, status, created_at, explanation) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    req_id,
+                    method,
+                    url,
+                    body,
+                    json.dumps(dict(self.headers)),
+                    mp,
+                    is_malicious,
+                    "pending",
+                    created_at,
+                    json.dumps(explanation) if explanation else None
+                )
+            )
             conn.commit()
             conn.close()
+
+            if is_malicious:
+                conn = sqlite3.connect(DB_PATH)
+                c = conn.cursor()
+                c.execute("UPDATE logs1 SET status = ? WHERE id = ?", (status, req_id))
+                conn.commit()
+                conn.close()
+
+        # ---------- Export (queued, never blocks) ----------
+        get_exporter().publish(dict(event, status=status))
+        ticket.inspected()
+
+        if is_malicious and decision.action != "monitor":
             self.send_response(403)
             self.send_header("Content-Type", "application/json")
             self.end_headers()
             self.wfile.write(json.dumps({
                 "status": "blocked",
-                "reason": f"malicious_prob={mp}"
+                "reason": f"malicious_prob={mp}",
+                "rule": decision.rule,
+                "explanation": explanation["summary"] if explanation else None
             }).encode())
             return
 
+        self.forward(method, url, raw_body)
+
+    def refuse_oversized(self, content_len, decision):
+        """Fail closed: a body the WAF will not inspect in full is never forwarded."""
+        self.close_connection = True  # the body was not read
+        if content_len < 0:
+            status, reason = 400, f"invalid Content-Length {content_len}"
+        else:
+            status, reason = 413, f"body of {content_len} bytes exceeds the inspection limit of {MAX_BODY_BYTES}"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(json.dumps({
+            "status": "blocked",
+            "reason": reason,
+            "rule": decision.rule
+        }).encode())
+
+    def shed(self, method, url, raw_body, decision, ticket, reason=None):
+        """Overloaded: refuse with 503 (fail closed) or forward uninspected (fail open, bounded)."""
+        controller = get_load_controller()
+        fail_mode = controller.shed_request(decision.fail_mode)
+        reason = reason or ticket.reason
+        if decision.action != "skip":
+            get_exporter().publish({
+                "id": str(uuid.uuid4()),
+                "method": method,
+                "url": url,
+                "headers": dict(self.headers),
+                "status": "shed",
+                "created_at": datetime.utcnow().isoformat(),
+                "policy": decision.to_dict(),
+                "shed": {"reason": reason, "fail_mode": fail_mode}
+            })
+
+        if fail_mode == "open":
+            try:
+                self.forward(method, url, raw_body)
+            finally:
+                controller.release_open()
+            return
+
+        self.send_response(503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(json.dumps({
+            "status": "shed",
+            "reason": reason,
+            "rule": decision.rule
+        }).encode())
+
+    def forward(self, method, url, raw_body):
         try:
             req = urllib.request.Request(
                 url,
-                data=body.encode() if body else None,
+                data=raw_body or None,
                 method=method
             )
             resp = urllib.request.urlopen(req)
@@ -166,6 +273,14 @@ class AIProxy(http.server.SimpleHTTPRequestHandler):
             self.send_error(500, f"Proxy error: {e}")
 
 
+class ProxyServer(socketserver.ThreadingTCPServer):
+    # allow stop/start (and replay runs) to rebind 8888 while old sockets sit in TIME_WAIT
+    allow_reuse_address = True
+    daemon_threads = True
+    # the default listen backlog of 5 drops SYNs in bursts long before admission control sees them
+    request_queue_size = 128
+
+
 # GLOBAL PROXY INSTANCE
 proxy_server = None
 proxy_thread = None
@@ -177,9 +292,14 @@ def start_proxy():
     if proxy_server:
         return False  # already running
 
+    # configuration errors stop the start instead of failing every proxied request
+    check_servable()
+    get_load_controller()
+    init_db()
+
     def run():
         global proxy_server
-        with socketserver.ThreadingTCPServer(("0.0.0.0", 8888), AIProxy) as httpd:
+        with ProxyServer(("0.0.0.0", 8888), AIProxy) as httpd:
             proxy_server = httpd
             print("🚀 Proxy started on port 8888")
             httpd.serve_forever()
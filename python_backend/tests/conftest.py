@@ -0,0 +1,48 @@
+# Backend modules are imported by plain name (python_backend/ is the working
+# directory when the API runs), and the training helpers live in
+# model_training/.
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(BACKEND.parent / "model_training"))
+
+import http.client  # noqa: E402
+import threading  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def proxy(monkeypatch, tmp_path):
+    """
+    Start AIProxy on a free port with a scratch database, its own load
+    controller and policy (none unless ``policy_path`` is given). Returns a
+    function that sends one request through it and returns the response.
+    """
+    import load_control
+    import policy
+    import proxy_server
+
+    servers = []
+
+    def start(controller=None, policy_path=None):
+        monkeypatch.setattr(load_control, "_controller", controller or load_control.LoadController())
+        monkeypatch.setattr(policy, "_store", policy.PolicyStore(policy_path or tmp_path / "policy.json"))
+        monkeypatch.setattr(proxy_server, "DB_PATH", str(tmp_path / "waf.db"))
+        server = proxy_server.ProxyServer(("127.0.0.1", 0), proxy_server.AIProxy)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+        def send(method, url, body=None):
+            conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+            conn.request(method, url, body=body)
+            return conn.getresponse()
+
+        return send
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
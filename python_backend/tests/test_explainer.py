@@ -0,0 +1,111 @@
+# TreePathExplainer is what the proxy scores every request with: its
+# probability must equal predict_proba and its breakdown must add up.
+#
+#   cd python_backend && python -m pytest tests
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+from explainer import TreePathExplainer, build_explainer, describe, top_contributions
+from feature_extractor import BASE_FEATURES, EXTENDED_FEATURES
+
+
+def dataset(n_features, integer, seed=0, rows=600):
+    rng = np.random.RandomState(seed)
+    X = rng.randint(0, 10, size=(rows, n_features)).astype(float)
+    if not integer:
+        X = X + rng.random_sample(size=X.shape)  # thresholds land on arbitrary floats
+    y = (X[:, 0] - X[:, 1] + 0.5 * X[:, -1] + rng.normal(0, 1, rows) < 3).astype(int)
+    return X, y
+
+
+MODELS = {
+    "forest-base": (BASE_FEATURES, True, lambda: RandomForestClassifier(n_estimators=25, random_state=0)),
+    "forest-extended": (EXTENDED_FEATURES, False,
+                        lambda: RandomForestClassifier(n_estimators=15, max_depth=10, random_state=1)),
+    "tree": (BASE_FEATURES, True, lambda: DecisionTreeClassifier(random_state=0)),
+}
+
+
+@pytest.fixture(params=list(MODELS), scope="module")
+def fitted(request):
+    names, integer, factory = MODELS[request.param]
+    X, y = dataset(len(names), integer)
+    model = factory().fit(X, y)
+    probe = np.vstack([X[:100], dataset(len(names), integer, seed=5, rows=200)[0]])
+    return model, names, probe
+
+
+@pytest.mark.parametrize("target_class", [0, 1])
+def test_probability_matches_predict_proba(fitted, target_class):
+    model, names, probe = fitted
+    explainer = TreePathExplainer(model, names, target_class=target_class)
+    expected = model.predict_proba(probe)[:, list(model.classes_).index(target_class)]
+    got = np.array([explainer.explain(x)["probability"] for x in probe])
+    np.testing.assert_allclose(got, expected, rtol=0, atol=1e-12)
+
+
+def test_contributions_add_up_to_the_probability(fitted):
+    model, names, probe = fitted
+    explainer = TreePathExplainer(model, names)
+    for x in probe:
+        verdict = explainer.explain(x)
+        assert list(verdict["contributions"]) == list(names)
+        total = verdict["baseValue"] + sum(verdict["contributions"].values())
+        assert total == pytest.approx(verdict["probability"], abs=1e-12)
+
+
+def test_base_value_is_the_mean_root_probability(fitted):
+    model, names, _ = fitted
+    estimators = getattr(model, "estimators_", [model])
+    roots = [est.tree_.value[0, 0] / est.tree_.value[0, 0].sum() for est in estimators]
+    expected = float(np.mean([r[list(model.classes_).index(0)] for r in roots]))
+    assert TreePathExplainer(model, names).base_value == pytest.approx(expected, abs=1e-12)
+
+
+def test_repeated_vectors_are_served_from_the_cache():
+    X, y = dataset(len(BASE_FEATURES), True)
+    explainer = TreePathExplainer(RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y),
+                                  BASE_FEATURES, cache_size=2)
+    first = explainer.explain([1, 0, 0, 0, 2, 0])
+    first["contributions"]["single_q"] = 99.0  # callers may modify what they get back
+    again = explainer.explain((1, 0, 0, 0, 2, 0))
+    assert again["contributions"]["single_q"] != 99.0
+    info = explainer.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+    for vector in ([0] * 6, [2] * 6, [3] * 6):
+        explainer.explain(vector)
+    assert explainer.cache_info().currsize == 2
+
+
+def test_non_tree_models_have_no_explainer():
+    X, y = dataset(len(BASE_FEATURES), True)
+    assert build_explainer(LogisticRegression().fit(X, y), BASE_FEATURES) is None
+
+
+VERDICT = {
+    "probability": 0.8,
+    "baseValue": 0.3,
+    "contributions": {"single_q": 0.35, "double_q": 0.0, "dashes": 0.2, "braces": -0.05,
+                      "spaces": 0.0, "badwords": 0.0},
+}
+FEATURES = {"single_q": 2, "double_q": 0, "dashes": 1, "braces": 1, "spaces": 3, "badwords": 0}
+
+
+def test_top_contributions_are_ranked_by_magnitude():
+    assert top_contributions(VERDICT, FEATURES) == [
+        {"feature": "single_q", "value": 2, "contribution": 0.35},
+        {"feature": "dashes", "value": 1, "contribution": 0.2},
+        {"feature": "braces", "value": 1, "contribution": -0.05},
+    ]
+    assert len(top_contributions(VERDICT, FEATURES, limit=len(FEATURES))) == len(FEATURES)
+
+
+def test_describe():
+    assert describe(VERDICT, FEATURES) == \
+        "base rate 0.300; single_q=2 (+0.350), dashes=1 (+0.200), braces=1 (-0.050)"
+    flat = dict(VERDICT, contributions=dict.fromkeys(FEATURES, 0.0))
+    assert describe(flat, FEATURES) == "base rate 0.300"
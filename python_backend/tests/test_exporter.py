@@ -0,0 +1,186 @@
+# End-to-end runs of the export sinks: FileSink into a temporary directory
+# and SyslogSink into the stub SyslogReceiver.
+#
+#   cd python_backend && python -m pytest tests
+import gzip
+import json
+import queue
+import threading
+import time
+
+import pytest
+
+from exporter import (
+    RECORD_FIELDS,
+    SYSLOG_MAX_DATAGRAM,
+    FileSink,
+    Sink,
+    SyslogReceiver,
+    SyslogSink,
+    flatten,
+)
+
+
+def event(n=0, **fields):
+    """The shape of what proxy_server publishes."""
+    return dict({
+        "id": f"req-{n}",
+        "method": "POST",
+        "url": f"http://shop.example/login?n={n}",
+        "body": "user=admin' or 1=1--&pass=x",
+        "headers": {"Host": "shop.example", "User-Agent": "sqlmap/1.7"},
+        "malicious_prob": 0.93,
+        "malicious": True,
+        "status": "blocked",
+        "created_at": "2026-01-01T12:00:00.000000",
+        "explanation": {"summary": "single quotes, dashes", "baseValue": 0.4, "contributions": []},
+        "policy": {"rule": "login", "action": "inspect", "threshold": 0.1, "fail_mode": "closed"},
+        "degraded": False,
+    }, **fields)
+
+
+def test_file_sink_writes_rotated_gzip_jsonl(tmp_path):
+    sink = FileSink(tmp_path, rotate_bytes=2048, flush_interval=0.05, batch_size=50)
+    events = [event(n, body="x" * (n % 7) * 100) for n in range(300)]
+    for e in events:
+        assert sink.submit(e)
+    sink.close()
+
+    assert not list(tmp_path.glob("*.part"))
+    files = sorted(tmp_path.glob("waf-*.jsonl.gz"))
+    assert len(files) == sink.files > 1
+    read = []
+    for path in files:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            read.extend(json.loads(line) for line in f)
+    assert read == events
+    assert sink.stats()["written"] == 300 and sink.stats()["dropped"] == 0
+
+
+@pytest.fixture
+def syslog():
+    receiver = SyslogReceiver()
+    sink = SyslogSink(receiver.address, flush_interval=0.05)
+    yield sink, receiver
+    sink.close()
+    receiver.close()
+
+
+def receive(receiver, count):
+    datagrams = [receiver.messages.get(timeout=5) for _ in range(count)]
+    with pytest.raises(queue.Empty):
+        receiver.messages.get(timeout=0.2)
+    return datagrams
+
+
+@pytest.mark.parametrize("fields, trimmed", [
+    ({}, None),
+    ({"body": "é" * 10000}, ["body"]),
+    ({"headers": {f"X-Header-{i}": "é'" * 50 for i in range(100)}}, ["body", "headers"]),
+    ({"headers": {"Cookie": "a" * 9000}, "url": "http://shop.example/?q=" + "b" * 9000},
+     ["body", "headers", "explanation", "url"]),
+])
+def test_syslog_datagrams_always_parse(syslog, fields, trimmed):
+    sink, receiver = syslog
+    sent = event(1, **fields)
+    sink.submit(sent)
+    (datagram,) = receive(receiver, 1)
+
+    assert len(datagram) <= SYSLOG_MAX_DATAGRAM
+    priority, received = SyslogReceiver.parse(datagram)
+    assert priority == 16 * 8 + 4
+    assert received.get("truncated") == trimmed
+    for field in trimmed or []:
+        assert received[field] is None
+    kept = {k: v for k, v in sent.items() if k not in (trimmed or [])}
+    assert {k: received[k] for k in kept} == kept
+
+
+def test_syslog_drops_events_that_cannot_fit(syslog):
+    sink, receiver = syslog
+    sink.submit(event(1, method="X" * SYSLOG_MAX_DATAGRAM))
+    sink.submit(event(2))
+    (datagram,) = receive(receiver, 1)
+
+    assert SyslogReceiver.parse(datagram)[1]["id"] == "req-2"
+    stats = sink.stats()
+    assert (stats["written"], stats["dropped"]) == (1, 1)
+
+
+class StuckSink(Sink):
+    """A sink whose writer blocks until released, like a collector that stopped reading."""
+
+    name = "stuck"
+
+    def __init__(self, **kwargs):
+        self.release = threading.Event()
+        self.batches = []
+        super().__init__(**kwargs)
+
+    def write_batch(self, batch):
+        self.release.wait(10)
+        self.batches.append(batch)
+
+
+def test_queue_is_bounded_by_bytes():
+    sink = StuckSink(queue_size=1000, queue_bytes=64 * 1024, flush_interval=0.01, batch_size=1)
+    try:
+        accepted = sum(sink.submit(event(n, body="x" * 16 * 1024)) for n in range(20))
+        stats = sink.stats()
+        # one event is held by the stuck writer, at most four 16KB bodies fit in the queue
+        assert accepted <= 5
+        assert stats["queued_bytes"] <= stats["capacity_bytes"]
+        assert stats["dropped"] == 20 - accepted
+    finally:
+        sink.release.set()
+        sink.close()
+
+
+def test_close_does_not_hang_on_a_stuck_writer():
+    sink = StuckSink(queue_size=2, flush_interval=0.01, batch_size=1)
+    for n in range(4):
+        sink.submit(event(n))
+    start = time.monotonic()
+    sink.close(timeout=0.3)
+    assert time.monotonic() - start < 2
+    sink.release.set()
+
+
+class FailingSink(Sink):
+    name = "failing"
+
+    def write_batch(self, batch):
+        raise OSError("collector unreachable")
+
+
+def test_failed_batches_count_as_dropped():
+    sink = FailingSink(flush_interval=0.01)
+    for n in range(5):
+        sink.submit(event(n))
+    sink.close()
+    stats = sink.stats()
+    assert (stats["written"], stats["dropped"]) == (0, 5)
+    assert stats["errors"] >= 1 and "unreachable" in stats["last_error"]
+
+
+def test_flatten_keeps_shed_and_degraded_events_apart():
+    shed = event(1, status="shed", shed={"reason": "queue_full", "fail_mode": "closed"})
+    del shed["degraded"]
+    records = [flatten(event(0)), flatten(event(2, degraded=True)), flatten(shed)]
+    assert all(tuple(r) == RECORD_FIELDS for r in records)
+    assert [(r["degraded"], r["shed_reason"], r["fail_mode"]) for r in records] == [
+        (False, None, "closed"), (True, None, "closed"), (True, "queue_full", "closed"),
+    ]
+    assert records[0]["threshold"] == 0.1
+
+
+def test_parquet_files_have_the_flat_schema(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    sink = FileSink(tmp_path, fmt="parquet", flush_interval=0.05)
+    sink.submit(event(0))
+    sink.submit(event(1, status="shed", shed={"reason": "queue_timeout", "fail_mode": "open"}))
+    sink.close()
+    (path,) = tmp_path.glob("*.parquet")
+    table = pq.read_table(path)
+    assert tuple(table.column_names) == RECORD_FIELDS
+    assert table.column("shed_reason").to_pylist() == [None, "queue_timeout"]
@@ -0,0 +1,79 @@
+# Shedding under overload: fail closed by default, bounded fail-open forwarding.
+#
+#   cd python_backend && python -m pytest tests
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import load_control
+from load_control import LoadController
+
+BACKEND = Path(load_control.__file__).resolve().parent
+
+
+def test_fail_closed_by_default():
+    assert load_control.FAIL_MODE == "closed"
+    controller = LoadController()
+    assert controller.shed_request() == "closed"
+
+
+def test_fail_open_forwards_are_bounded():
+    controller = LoadController(fail_mode="open", fail_open_concurrency=2)
+    assert [controller.shed_request() for _ in range(3)] == ["open", "open", "closed"]
+    controller.release_open()
+    assert controller.shed_request() == "open"
+
+    snapshot = controller.snapshot()
+    assert snapshot["shed"] == {"open": 3, "closed": 1}
+    assert (snapshot["forwarding_open"], snapshot["fail_open_overflow"]) == (2, 1)
+
+
+def test_rule_fail_mode_overrides_default():
+    controller = LoadController(fail_mode="closed")
+    assert controller.shed_request("open") == "open"
+    assert LoadController(fail_mode="open").shed_request("closed") == "closed"
+
+
+def overloaded(**config):
+    """A controller whose single admission slot is taken, so every request is shed."""
+    controller = LoadController(max_concurrency=1, queue_size=0, **config)
+    controller.admit()
+    return controller
+
+
+@pytest.mark.parametrize("config", [{}, {"fail_mode": "open", "fail_open_concurrency": 0}])
+def test_shed_requests_are_refused(proxy, config):
+    controller = overloaded(**config)
+    response = proxy(controller)("POST", "http://upstream.invalid/login", b"user=admin' or 1=1--")
+
+    assert response.status == 503
+    assert response.getheader("Retry-After") == "1"
+    assert json.loads(response.read())["reason"] == "queue_full"
+    assert controller.snapshot()["shed"]["closed"] == 1
+
+
+def test_degraded_mode_does_not_forward_large_bodies_partly_inspected(proxy):
+    controller = LoadController(degrade="body")
+    with controller._lock:
+        controller._enter_degraded("test")
+    body = b"a" * load_control.DEGRADED_BODY_BYTES + b"' union select 1-- "
+    response = proxy(controller)("POST", "http://upstream.invalid/login", body)
+
+    assert response.status == 503
+    assert json.loads(response.read())["reason"] == "degraded_body"
+    assert controller.snapshot()["shed"]["closed"] == 1
+
+
+@pytest.mark.parametrize("env, value", [("WAF_FAIL_MODE", "sometimes"), ("WAF_DEGRADE", "db,everything")])
+def test_bad_config_stops_proxy_start(env, value):
+    # the environment is read at import, so start a fresh interpreter
+    result = subprocess.run(
+        [sys.executable, "-c", "import proxy_server; proxy_server.start_proxy()"],
+        cwd=BACKEND, env=dict(os.environ, **{env: value}), capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode != 0
+    assert "LoadConfigError" in result.stderr and "Proxy started" not in result.stdout
@@ -0,0 +1,131 @@
+# The memory-mapped artifact must score exactly like the forest it was
+# exported from, reject damaged files, and serving must never unpickle
+# without WAF_ALLOW_PICKLE.
+#
+#   cd python_backend && python -m pytest tests
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+import model_store
+from feature_extractor import BASE_FEATURES
+from model_artifact import (
+    MAGIC,
+    ArtifactError,
+    export_model,
+    file_sha256,
+    load_artifact,
+    read_header,
+    verify_equivalence,
+)
+
+
+def training_set(seed=0, rows=400):
+    rng = np.random.RandomState(seed)
+    X = rng.randint(0, 12, size=(rows, len(BASE_FEATURES)))
+    y = (X[:, 0] + 2 * X[:, 5] + rng.randint(0, 4, size=rows) < 14).astype(int)  # 0 = malicious
+    return X, y
+
+
+@pytest.fixture(params=["forest", "tree"])
+def model(request):
+    X, y = training_set()
+    if request.param == "forest":
+        return RandomForestClassifier(n_estimators=7, max_depth=8, random_state=0).fit(X, y)
+    return DecisionTreeClassifier(max_depth=6, random_state=0).fit(X, y)
+
+
+@pytest.fixture
+def exported(model, tmp_path):
+    pickle_path = tmp_path / "model.pkl"
+    joblib.dump(model, pickle_path)
+    path = tmp_path / "model.wafrf"
+    export_model(model, path, 0.25, feature_set="base", source_sha256=file_sha256(pickle_path))
+    return model, pickle_path, path
+
+
+def test_artifact_matches_predict_proba(exported):
+    model, _, path = exported
+    artifact = load_artifact(path)
+    X = np.vstack([training_set(seed=1)[0], np.random.RandomState(2).randint(0, 40, size=(300, 6))])
+
+    expected = model.predict_proba(X)[:, list(model.classes_).index(0)]
+    got = np.array([artifact.explainer.explain(x)["probability"] for x in X])
+    np.testing.assert_allclose(got, expected, rtol=0, atol=1e-12)
+    assert (artifact.feature_set, artifact.threshold) == ("base", 0.25)
+
+
+def test_artifact_arrays_are_mapped_not_copied(exported):
+    artifact = load_artifact(exported[2])
+    assert not artifact.explainer.feature.flags.writeable
+
+
+def test_verify_equivalence(exported):
+    _, pickle_path, path = exported
+    assert verify_equivalence(pickle_path, path, samples=200) <= 1e-9
+
+
+def test_shipped_artifact_matches_shipped_pickle():
+    header, _ = read_header(model_store.ARTIFACT_PATH.read_bytes())
+    assert header["source_sha256"] == file_sha256(model_store.PICKLE_PATH)
+    assert verify_equivalence(model_store.PICKLE_PATH, model_store.ARTIFACT_PATH, samples=500) <= 1e-9
+
+
+def test_tampered_artifact_is_rejected(exported):
+    path = exported[2]
+    data = bytearray(path.read_bytes())
+    data[-9] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(ArtifactError, match="checksum"):
+        load_artifact(path)
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: b"NOTWAF!!" + data[len(MAGIC):],
+    lambda data: data.replace(b'"format_version": 1', b'"format_version": 9'),
+])
+def test_foreign_or_newer_files_are_rejected(exported, corrupt):
+    path = exported[2]
+    path.write_bytes(corrupt(path.read_bytes()))
+    with pytest.raises(ArtifactError):
+        load_artifact(path)
+
+
+def test_pickles_are_refused_without_opt_in(exported, monkeypatch, tmp_path):
+    _, pickle_path, path = exported
+    with pytest.raises(model_store.ModelLoadError, match="WAF_ALLOW_PICKLE"):
+        model_store.load(pickle_path, allow_pickle=False)
+    with pytest.raises(model_store.ModelLoadError):
+        model_store.check_servable(str(pickle_path), allow_pickle=False)
+    model_store.check_servable(str(path), allow_pickle=False)
+
+    # no artifact next to the module: the default load refuses too
+    monkeypatch.setattr(model_store, "ARTIFACT_PATH", tmp_path / "missing.wafrf")
+    monkeypatch.setattr(model_store, "PICKLE_PATH", pickle_path)
+    with pytest.raises(model_store.ModelLoadError):
+        model_store.check_servable(None, allow_pickle=False)
+    with pytest.raises(model_store.ModelLoadError):
+        model_store.load(allow_pickle=False)
+
+
+def test_opted_in_pickle_scores_like_the_artifact(exported):
+    _, pickle_path, path = exported
+    pickled = model_store.load(pickle_path, allow_pickle=True)
+    mapped = model_store.load(path)
+    for x in training_set(seed=3, rows=50)[0]:
+        features = dict(zip(BASE_FEATURES, x))
+        assert pickled.score(features)[0] == pytest.approx(mapped.score(features)[0], abs=1e-12)
+
+
+def test_newer_pickle_does_not_replace_the_artifact(exported, monkeypatch, capsys):
+    _, pickle_path, path = exported
+    pickle_path.touch()
+    monkeypatch.setattr(model_store, "ARTIFACT_PATH", path)
+    monkeypatch.setattr(model_store, "PICKLE_PATH", pickle_path)
+    os.utime(path, (0, 0))
+    assert model_store.load(allow_pickle=False).path == path
+    assert "newer" in capsys.readouterr().out
@@ -0,0 +1,169 @@
+# Parity of the three feature entry points (training, API, proxy) and
+# regression tests for normalizer.py.
+#
+#   cd python_backend && python -m pytest tests
+import csv
+import http.client
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from feature_extractor import BASE_FEATURES, EXTENDED_FEATURES, extract_features, to_vector
+from normalizer import MAX_DECODE_ROUNDS, normalize
+
+TRAINING_CSV = Path(__file__).resolve().parents[2] / "model_training" / "train_data.csv"
+
+HEADER_SETS = [
+    {},
+    {"Host": "shop.example", "User-Agent": "Mozilla/5.0", "Accept": "*/*"},
+    {"Host": "shop.example", "User-Agent": "sqlmap/1.7 (union select)", "Cookie": "id=1' or 1=1--"},
+    {"Host": "shop.example", "X-Forwarded-For": "127.0.0.1%27%20union%20select", "Referer": "/a?q=sleep(5)#"},
+]
+
+
+def raw_request(method, path, body, headers):
+    head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return f"{method} {path} HTTP/1.1\r\n{head}\r\n{body}".encode("utf-8")
+
+
+def training_vector(raw):
+    from log_parser import ExtractFeatures, parse_log
+
+    request = parse_log(raw)
+    return ExtractFeatures(request["method"], request["path"], request["body"], request["headers"])[3:9]
+
+
+def api_features(raw):
+    import app
+    from log_parser import parse_log
+
+    request = parse_log(raw)
+    return app.extract_features(request["path"], request["body"], request["headers"])
+
+
+def proxy_features(raw, feature_set, view=False):
+    """What AIProxy sees: the request line, headers parsed by http.client, the raw body bytes."""
+    from proxy_server import request_features
+
+    head, _, body = raw.partition(b"\r\n\r\n")
+    request_line, _, header_block = head.partition(b"\r\n")
+    headers = http.client.parse_headers(io.BytesIO(header_block + b"\r\n\r\n"))
+    path = request_line.split(b" ")[1].decode("iso-8859-1")
+    return request_features(path, memoryview(body) if view else body, headers, feature_set)
+
+
+def load_rows(limit=400, label=None):
+    with open(TRAINING_CSV, newline="", encoding="utf-8") as f:
+        rows = [(r["method"], r["path"], r["body"]) for r in csv.DictReader(f, escapechar="\\")
+                if label is None or r["class"] == label]
+    if limit is None:
+        return rows
+    # spread over the file so both classes are covered
+    return rows[::max(len(rows) // limit, 1)][:limit]
+
+
+@pytest.mark.parametrize("headers", HEADER_SETS, ids=["none", "browser", "attack-headers", "encoded-headers"])
+def test_entry_points_agree(headers):
+    for method, path, body in load_rows():
+        raw = raw_request(method, path, body, headers)
+        training = training_vector(raw)
+        api = to_vector(api_features(raw), BASE_FEATURES)
+        proxy = to_vector(proxy_features(raw, "base"), BASE_FEATURES)
+        view = to_vector(proxy_features(raw, "base", view=True), BASE_FEATURES)
+        assert training == api == proxy == view, (path, body, training, api, proxy, view)
+
+
+def test_extended_features_agree_for_bytes_str_and_memoryview():
+    headers = HEADER_SETS[2]
+    for method, path, body in load_rows(100):
+        raw = raw_request(method, path, body, headers)
+        proxy = to_vector(proxy_features(raw, "extended"), EXTENDED_FEATURES)
+        view = to_vector(proxy_features(raw, "extended", view=True), EXTENDED_FEATURES)
+        text = to_vector(extract_features(path, body, headers, feature_set="extended"), EXTENDED_FEATURES)
+        assert proxy == view == text
+
+
+def test_header_badwords_count_everywhere():
+    raw = raw_request("GET", "/a", "", HEADER_SETS[2])
+    assert training_vector(raw)[5] == api_features(raw)["badwords"] == proxy_features(raw, "base")["badwords"] > 0
+
+
+@pytest.mark.parametrize("payload", [
+    "%27%20union%20select",            # URL
+    "%2527%2520union%2520select",      # double URL
+    "&#39; union select",              # numeric entity
+    "&#x27;&#x20;union select",        # hex entity
+    "\\u0027 union select",            # unicode escape
+    "%u0027 union select",             # IIS %u escape
+    "%26%2339%3B union select",        # URL-encoded entity
+    "%27+UNION+SeLeCt",                # + as space, case folding
+])
+def test_encodings_decode_to_the_same_text(payload):
+    assert normalize(payload)[0] == "' union select"
+
+
+def test_decoding_is_bounded():
+    payload = "'"
+    for _ in range(MAX_DECODE_ROUNDS + 2):
+        payload = payload.replace("%", "%25").replace("'", "%27")
+    text, depth = normalize(payload)
+    assert depth == MAX_DECODE_ROUNDS
+    assert "'" not in text
+
+
+def test_bytes_input_is_decoded_like_str():
+    payload = "q=café%27%20or%201=1--"
+    assert normalize(payload) == normalize(payload.encode()) == normalize(memoryview(payload.encode()))
+
+
+@pytest.mark.parametrize("padding", [64 * 1024, 70000, 1024 * 1024])
+def test_keywords_after_large_padding_are_counted(padding):
+    body = b"a" * padding + b"' union select 1,2-- "
+    for feature_set in ("base", "extended"):
+        features = extract_features("/a", body, {}, feature_set=feature_set)
+        assert features["single_q"] == 1 and features["badwords"] >= 3, feature_set
+
+
+@pytest.mark.parametrize("url", ["http://upstream.invalid/login", "http://upstream.invalid/static/app.css"])
+def test_proxy_refuses_bodies_it_will_not_inspect(proxy, monkeypatch, url):
+    import policy
+    import proxy_server
+
+    monkeypatch.setattr(proxy_server, "MAX_BODY_BYTES", 1024)
+    # the example policy skips /static, which must not lift the body limit
+    send = proxy(policy_path=Path(policy.__file__).with_name("policy.example.json"))
+    response = send("POST", url, b"a" * 2048 + b"' union select 1-- ")
+    assert response.status == 413
+    assert json.loads(response.read())["status"] == "blocked"
+
+
+def served_verdict(method, path, body, headers=HEADER_SETS[1]):
+    """(is_malicious, prob) of the served model for one request, as the proxy computes it."""
+    from model_store import get_model
+    from proxy_server import waf_predict
+
+    raw = raw_request(method, path, body, headers)
+    is_malicious, prob, _ = waf_predict(proxy_features(raw, get_model().feature_set))
+    return is_malicious, prob
+
+
+def test_served_model_passes_benign_training_rows():
+    # the shipped model must be trained on this normalisation, not only agree across entry points
+    blocked = [(path, body) for method, path, body in load_rows(None, label="1")
+               if served_verdict(method, path, body)[0]]
+    assert not blocked, f"{len(blocked)} benign rows blocked, e.g. {blocked[:3]}"
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/checkout", "comment=Nice+product"),
+    ("/search?q=running+shoes", ""),
+    ("/contact", "name=Jane+Doe&email=jane%40example.com"),
+])
+def test_served_model_passes_plain_form_posts(path, body):
+    assert served_verdict("POST", path, body)[0] == 0
+
+
+def test_served_model_blocks_attacks():
+    assert served_verdict("POST", "/login", "user=admin%27+or+1%3D1--&pass=x")[0] == 1
@@ -0,0 +1,84 @@
+# Skip rules must match the path the upstream resolves, not the raw request line.
+#
+#   cd python_backend && python -m pytest tests
+import json
+from pathlib import Path
+
+import pytest
+
+from policy import UNCLEAN_RULE, Policy, normalize_path, split_target
+
+EXAMPLE = Path(__file__).resolve().parent.parent / "policy.example.json"
+
+
+@pytest.fixture(scope="module")
+def policy():
+    with open(EXAMPLE, encoding="utf-8") as f:
+        return Policy(json.load(f))
+
+
+def decide(policy, url):
+    return policy.evaluate(*split_target(url))
+
+
+@pytest.mark.parametrize("url, rule", [
+    ("http://shop/assets/app.css", "static-assets"),
+    ("http://shop/static/app.css", "static-dir"),
+    ("http://shop/static/img/logo", "static-dir"),
+    ("http://shop/login?next=/", "login"),
+    ("http://shop/index.php", "default"),
+    ("http://intranet.local/anything", "intranet"),
+    ("http://shop/static/./img/logo", "static-dir"),
+    ("http://shop//static//img/logo", "static-dir"),
+])
+def test_rules_still_match(policy, url, rule):
+    assert decide(policy, url).rule == rule
+
+
+@pytest.mark.parametrize("url", [
+    "http://shop/static/../admin?id=1' or 1=1--",
+    "http://shop/static/%2e%2e/admin?id=1'--",
+    "http://shop/static/..;/admin?id=1'--",
+    "http://shop/static;x/../admin?id=1'--",
+    "http://shop/admin.php;x.css?id=1'--",
+    "http://shop/admin.php%3bx.css?id=1'--",
+    "http://shop/health/../../admin?id=1'--",
+])
+def test_skip_rules_cannot_be_reached_by_path_tricks(policy, url):
+    decision = decide(policy, url)
+    assert decision.action == "inspect", (url, decision.rule)
+
+
+@pytest.mark.parametrize("path", [
+    "/static/%252e%252e/admin",   # double encoded
+    "/static/%ff.css",            # not UTF-8
+    "/static\\..\\admin",         # backslashes
+    "/static/%00.css",            # NUL
+    "/../static/app.css",         # above the root
+])
+def test_unclean_paths_are_inspected(policy, path):
+    assert normalize_path(path) is None
+    decision = policy.evaluate("shop", path)
+    assert (decision.rule, decision.action) == (UNCLEAN_RULE, "inspect")
+    assert decision.threshold == policy.default.threshold
+
+
+def test_normalize_path():
+    assert normalize_path("/a/./b/../c;v=1/d.css?x=../y") == ["a", "c", "d.css"]
+    assert normalize_path("/caf%C3%A9/") == ["café"]
+    assert normalize_path("/") == []
+
+
+@pytest.mark.parametrize("method, url, body, rule", [
+    ("GET", "http://shop/login/x.js", False, "login"),
+    ("GET", "http://shop/img/x.js", False, "static-assets"),
+    ("POST", "http://shop/api/upload.png", True, "static-assets"),
+    ("POST", "http://shop/doLogin.css", True, "static-assets"),
+    ("GET", "http://shop/static/app.css", True, "static-dir"),
+    ("PUT", "http://shop/static/app.css", False, "static-dir"),
+])
+def test_skip_only_allows_fetching_without_a_body(policy, method, url, body, rule):
+    host, path = split_target(url)
+    decision = policy.evaluate(host, path, method, has_body=body)
+    assert decision.rule == rule
+    assert decision.action == ("skip" if method == "GET" and not body and rule != "login" else "inspect")
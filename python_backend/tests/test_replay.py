@@ -0,0 +1,74 @@
+# Replay sources are streamed: paged reads from logs1, --limit applied at the
+# source, and the logged verdict mapped the way the proxy acts on it.
+#
+#   cd python_backend && python -m pytest tests
+import itertools
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+import replay  # noqa: E402
+
+ROWS = [
+    # id, method, url, malicious, status, created_at
+    ("a", "GET", "/a", 0, "pending", "2026-01-01T00:00:03"),
+    ("b", "POST", "/login", 1, "blocked", "2026-01-01T00:00:01"),
+    ("c", "GET", "/v1/x", 1, "monitored", "2026-01-01T00:00:02"),
+    ("d", "GET", "/d", 1, "pending", "2026-01-01T00:00:02"),
+    ("e", "GET", "/e", 0, "pending", None),
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "waf.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE logs1 (id TEXT PRIMARY KEY, method TEXT, url TEXT, body TEXT, headers TEXT, "
+                 "malicious_prob REAL, malicious INTEGER, status TEXT, created_at TEXT, explanation TEXT)")
+    conn.executemany("INSERT INTO logs1 (id, method, url, body, headers, malicious, status, created_at) "
+                     "VALUES (?, ?, ?, '', '{}', ?, ?, ?)", ROWS)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 500])
+def test_db_rows_are_paged_in_time_order(db, page_size):
+    rows = list(replay.iter_db(db, page_size=page_size))
+    assert [r["url"] for r in rows] == ["/e", "/login", "/v1/x", "/d", "/a"]
+    assert [r["expected"] for r in rows] == ["forwarded", "blocked", "forwarded", "blocked", "forwarded"]
+
+
+def test_limit_is_applied_at_the_source(db):
+    assert [r["url"] for r in replay.iter_db(db, limit=3, page_size=2)] == ["/e", "/login", "/v1/x"]
+
+
+def test_rows_logged_during_the_replay_are_not_replayed(db):
+    rows = replay.iter_db(db, page_size=1)
+    first = next(rows)
+    conn = sqlite3.connect(db)  # the proxy logging into the same file while it is read
+    conn.execute("INSERT INTO logs1 (id, method, url, created_at) VALUES ('z', 'GET', '/new', '2026-01-01T00:00:02')")
+    conn.commit()
+    conn.close()
+    assert [first["url"]] + [r["url"] for r in rows] == ["/e", "/login", "/v1/x", "/d", "/a"]
+
+
+def test_schedule_is_lazy():
+    def source():
+        yield {"time": None}
+        yield {"time": 100.0}
+        yield {"time": 104.0}
+        raise AssertionError("read past what was consumed")
+
+    scheduled = replay.schedule(source(), speed=2)
+    assert [r["offset"] for r in itertools.islice(scheduled, 3)] == [0.0, 0.0, 2.0]
+
+
+def test_burp_source_honours_limit():
+    log = Path(__file__).resolve().parents[2] / "model_training" / "burpsuite_sample_log.log"
+    assert len(list(replay.iter_burp(log, limit=2))) == 2
+    assert len(list(replay.iter_burp(log))) > 2